@@ -1,9 +1,22 @@
-from flask import Blueprint, jsonify, request, session
-from models import db, User, Product, Category, Transaction
+from flask import Blueprint, Response, current_app, g, jsonify, request, session, stream_with_context
+from models import db, User, Product, Category, Transaction, ArchivedTransaction
+from recommendations import recommender
+from suggest import suggester
+from inventory_stream import broker
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
 from functools import wraps
+from urllib.parse import urlsplit
 
 api = Blueprint('api', __name__)
 
+MAX_BULK_IDS = 500
+# Largest value a SQLite INTEGER primary key can hold
+MAX_ID = 2 ** 63 - 1
+MAX_BATCH_REQUESTS = 50
+# Endpoints a batch may not call: itself, and responses that never finish
+UNBATCHABLE_ENDPOINTS = {'api.batch', 'api.stream_inventory'}
+
 def api_auth_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -23,11 +36,36 @@ def admin_api_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def parse_ids():
+    """Ids from ``?ids=1,2,3`` in request order without repeats; None when not given."""
+    raw = request.args.get('ids')
+    if raw is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(part) for part in raw.split(',') if part.strip()))
+    except ValueError:
+        raise ValueError('ids must be a comma-separated list of integers')
+    # The cap is on distinct ids: repeats cost nothing to fetch
+    if len(ids) > MAX_BULK_IDS:
+        raise ValueError(f'At most {MAX_BULK_IDS} ids per request')
+    if any(i < 1 or i > MAX_ID for i in ids):
+        raise ValueError(f'ids must be between 1 and {MAX_ID}')
+    return ids
+
+def fetch_in_order(query, model, ids):
+    """Load ``ids`` with a single IN query and return them in the order asked for."""
+    found = {obj.id: obj for obj in query.filter(model.id.in_(ids)).all()} if ids else {}
+    return [found[i] for i in ids if i in found]
+
 # User API
 @api.route('/users', methods=['GET'])
 @admin_api_required
 def get_users():
-    users = User.query.all()
+    try:
+        ids = parse_ids()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    users = User.query.all() if ids is None else fetch_in_order(User.query, User, ids)
     return jsonify([{
         'id': u.id,
         'username': u.username,
@@ -49,11 +87,8 @@ def get_user(user_id):
     })
 
 # Product API
-@api.route('/products', methods=['GET'])
-@api_auth_required
-def get_products():
-    products = Product.query.all()
-    return jsonify([{
+def product_to_dict(p):
+    return {
         'id': p.id,
         'name': p.name,
         'price': p.price,
@@ -62,32 +97,88 @@ def get_products():
         'category_name': p.category.name if p.category else None,
         'quantity': p.quantity,
         'man_date': p.man_date.isoformat() if p.man_date else None
-    } for p in products])
+    }
+
+@api.route('/products', methods=['GET'])
+@api_auth_required
+def get_products():
+    try:
+        ids = parse_ids()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if ids is None:
+        products = Product.query.all()
+    else:
+        products = fetch_in_order(Product.query.options(joinedload(Product.category)), Product, ids)
+    return jsonify([product_to_dict(p) for p in products])
+
+@api.route('/products/suggest', methods=['GET'])
+@api_auth_required
+def suggest_products():
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), suggester.top_n))
+    return jsonify(suggester.suggest(query, limit))
 
 @api.route('/products/<int:product_id>', methods=['GET'])
 @api_auth_required
 def get_product(product_id):
     product = Product.query.get_or_404(product_id)
-    return jsonify({
-        'id': product.id,
-        'name': product.name,
-        'price': product.price,
-        'description': product.description,
-        'category_id': product.category_id,
-        'category_name': product.category.name if product.category else None,
-        'quantity': product.quantity,
-        'man_date': product.man_date.isoformat() if product.man_date else None
-    })
+    return jsonify(product_to_dict(product))
+
+@api.route('/products/<int:product_id>/recommendations', methods=['GET'])
+@api_auth_required
+def get_product_recommendations(product_id):
+    Product.query.get_or_404(product_id)
+    limit = max(1, min(request.args.get('limit', recommender.top_k, type=int), recommender.top_k))
+    scored = recommender.for_product(product_id, limit)
+    # One IN query for the recommended products, returned in score order
+    products = {p.id: p for p in Product.query.options(joinedload(Product.category))
+                .filter(Product.id.in_([other_id for other_id, _ in scored])).all()}
+    return jsonify([dict(product_to_dict(products[other_id]), score=count)
+                    for other_id, count in scored if other_id in products])
+
+# Inventory stream (Server-Sent Events)
+@api.route('/stream/inventory', methods=['GET'])
+@api_auth_required
+def stream_inventory():
+    # EventSource sends Last-Event-ID when it reconnects; the query parameter covers first connects
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+    if last_id is not None and not 0 <= last_id <= MAX_ID:
+        return jsonify({'error': f'Last-Event-ID must be between 0 and {MAX_ID}'}), 400
+
+    # The start position is fixed here, before the response, so no change committed
+    # after this request returns can be missed
+    subscriber = broker.subscribe(last_id)
+    if subscriber is None:
+        return jsonify({'error': 'Too many subscribers'}), 503, {'Retry-After': '5'}
+    response = Response(stream_with_context(broker.stream(subscriber)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: broker.unsubscribe(subscriber))
+    return response
 
 # Category API
 @api.route('/categories', methods=['GET'])
 @api_auth_required
 def get_categories():
-    categories = Category.query.all()
+    try:
+        ids = parse_ids()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    categories = Category.query.all() if ids is None else fetch_in_order(Category.query, Category, ids)
+    # Count products per category in one grouped query instead of loading them
+    counts = dict(db.session.execute(
+        select(Product.category_id, func.count(Product.id))
+        .where(Product.category_id.in_([c.id for c in categories]))
+        .group_by(Product.category_id)
+    ).all()) if categories else {}
     return jsonify([{
         'id': c.id,
         'name': c.name,
-        'product_count': len(c.products)
+        'product_count': counts.get(c.id, 0)
     } for c in categories])
 
 @api.route('/categories/<int:category_id>', methods=['GET'])
@@ -109,7 +200,14 @@ def get_category(category_id):
 @api.route('/transactions', methods=['GET'])
 @admin_api_required
 def get_transactions():
-    transactions = Transaction.query.order_by(Transaction.datetime.desc()).all()
+    if request.args.get('archived') == '1':
+        # The archive is unbounded, so it is only ever read a page at a time
+        limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+        offset = max(0, request.args.get('offset', 0, type=int))
+        transactions = (ArchivedTransaction.query.order_by(ArchivedTransaction.datetime.desc(), ArchivedTransaction.id.desc())
+                        .limit(limit).offset(offset).all())
+    else:
+        transactions = Transaction.query.order_by(Transaction.datetime.desc()).all()
     return jsonify([{
         'id': t.id,
         'user_id': t.user_id,
@@ -122,7 +220,8 @@ def get_transactions():
 @api.route('/transactions/<int:transaction_id>', methods=['GET'])
 @admin_api_required
 def get_transaction(transaction_id):
-    transaction = Transaction.query.get_or_404(transaction_id)
+    model = ArchivedTransaction if request.args.get('archived') == '1' else Transaction
+    transaction = model.query.get_or_404(transaction_id)
     return jsonify({
         'id': transaction.id,
         'user_id': transaction.user_id,
@@ -135,4 +234,64 @@ def get_transaction(transaction_id):
             'quantity': o.quantity,
             'price': o.price
         } for o in transaction.orders]
-    })
\ No newline at end of file
+    })
+
+def run_batched(app, parent_session, path, method):
+    """Dispatch one sub-request of a batch and return its {'path', 'status', 'body'} entry."""
+    url = urlsplit(path)
+    rejected = {'path': path, 'status': 400, 'body': {'error': 'Only non-streaming GET /api/... requests can be batched'}}
+    if method != 'GET' or not url.path.startswith('/api/'):
+        return rejected
+    # Sub-requests run inside this app context, so they share its DB session
+    # (and identity map) and reuse the caller's already-loaded login session
+    ctx = app.test_request_context(url.path, query_string=url.query, method='GET',
+                                   headers={'Accept': 'application/json'},
+                                   environ_base={'REMOTE_ADDR': request.remote_addr})
+    ctx.session = parent_session
+    with ctx:
+        # Decide on the endpoint the URL actually routes to, not on the raw path
+        if request.routing_exception is None and (request.blueprint != 'api'
+                                                  or request.endpoint in UNBATCHABLE_ENDPOINTS):
+            return rejected
+        try:
+            sub_response = app.full_dispatch_request()
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Batched request %s failed', path)
+            return {'path': path, 'status': 500, 'body': {'error': 'Internal server error'}}
+        if sub_response.is_streamed and sub_response.status_code < 400:
+            # Error pages are iterators too, but only a successful stream can run forever
+            sub_response.close()
+            return rejected
+        if sub_response.is_json:
+            body = sub_response.get_json(silent=True)
+        elif sub_response.status_code >= 400:
+            body = {'error': sub_response.status}
+        else:
+            body = sub_response.get_data(as_text=True)
+        return {'path': path, 'status': sub_response.status_code, 'body': body}
+
+# Batch API: several GET requests in one round trip
+@api.route('/batch', methods=['POST'])
+@api_auth_required
+def batch():
+    payload = request.get_json(silent=True) or {}
+    sub_requests = payload.get('requests')
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({'error': 'Expected {"requests": [{"path": "/api/..."}, ...]}'}), 400
+    if len(sub_requests) > MAX_BATCH_REQUESTS:
+        return jsonify({'error': f'At most {MAX_BATCH_REQUESTS} requests per batch'}), 400
+
+    app = current_app._get_current_object()
+    parent_session = session._get_current_object()
+    responses = []
+    # Sub-requests are paid for by this request's own rate-limit token (see the 'api.batch' rule)
+    g.ratelimit_batch = True
+    try:
+        for sub in sub_requests:
+            path = sub.get('path', '') if isinstance(sub, dict) else ''
+            method = (sub.get('method') or 'GET').upper() if isinstance(sub, dict) else 'GET'
+            responses.append(run_batched(app, parent_session, path, method))
+    finally:
+        g.pop('ratelimit_batch', None)
+    return jsonify({'responses': responses})
@@ -1,24 +1,35 @@
 from flask import Flask
-from models import User, db
+from models import User, db, ensure_autoincrement, ensure_indexes
 from routes import main
 from api import api
-from config import DevelopmentConfig # Import your config class
+from ratelimit import limiter
+from commands import register_commands
+from health import health
+from config import config_from_env # Import your config class
 
-def create_app(config_class=DevelopmentConfig):
+def create_app(config_class=None):
     app = Flask(__name__)
+    config_class = config_class or config_from_env()
     
     # Load configuration from the class
     app.config.from_object(config_class)
 
     # Initialize extensions
     db.init_app(app)
+    limiter.init_app(app)
 
     # Register Blueprints
     app.register_blueprint(main)
     app.register_blueprint(api, url_prefix='/api')
+    app.register_blueprint(health)
+
+    # Register CLI commands (flask <command>)
+    register_commands(app)
 
     with app.app_context():
         db.create_all()
+        ensure_autoincrement()
+        ensure_indexes()
         User.ensure_admin_exists()
     return app
 
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select, update
+from models import (db, Transaction, Order, ArchivedTransaction, ArchivedOrder,
+                    UserPurchaseSummary, ProductSalesSummary)
+
+def _add_to_summary(model, key_column, key, **totals):
+    """Add totals to a summary row, creating it on first use."""
+    values = {name: getattr(model, name) + value for name, value in totals.items() if name != 'last_purchase'}
+    if 'last_purchase' in totals:
+        # Batches are archived oldest first, so the newest archived purchase wins
+        values['last_purchase'] = totals['last_purchase']
+    updated = db.session.execute(update(model).where(key_column == key).values(**values)).rowcount
+    if not updated:
+        db.session.add(model(**{key_column.key: key}, **totals))
+
+def archive_batch(cutoff, batch_size):
+    """Move the oldest ``batch_size`` transactions before ``cutoff`` and their orders.
+
+    Returns the number of transactions moved. Everything happens in one
+    database transaction, so a batch is either fully archived or untouched.
+    """
+    ids = db.session.execute(
+        select(Transaction.id).where(Transaction.datetime < cutoff)
+        .order_by(Transaction.datetime).limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+
+    db.session.execute(insert(ArchivedTransaction).from_select(
+        ['id', 'user_id', 'datetime'],
+        select(Transaction.id, Transaction.user_id, Transaction.datetime).where(Transaction.id.in_(ids))
+    ))
+    db.session.execute(insert(ArchivedOrder).from_select(
+        ['id', 'transaction_id', 'product_id', 'quantity', 'price'],
+        select(Order.id, Order.transaction_id, Order.product_id, Order.quantity, Order.price)
+        .where(Order.transaction_id.in_(ids))
+    ))
+
+    # Fold the batch into the per-user and per-product summaries
+    per_user = db.session.execute(
+        select(Transaction.user_id, func.count(func.distinct(Transaction.id)), func.max(Transaction.datetime),
+               func.coalesce(func.sum(Order.quantity), 0), func.coalesce(func.sum(Order.quantity * Order.price), 0))
+        .outerjoin(Order, Order.transaction_id == Transaction.id)
+        .where(Transaction.id.in_(ids)).group_by(Transaction.user_id)
+    ).all()
+    for user_id, transactions, last_purchase, items, spent in per_user:
+        _add_to_summary(UserPurchaseSummary, UserPurchaseSummary.user_id, user_id, transactions=transactions,
+                        items=items, total_spent=spent, last_purchase=last_purchase)
+
+    per_product = db.session.execute(
+        select(Order.product_id, func.count(Order.id), func.sum(Order.quantity), func.sum(Order.quantity * Order.price))
+        .where(Order.transaction_id.in_(ids)).group_by(Order.product_id)
+    ).all()
+    for product_id, orders, quantity, revenue in per_product:
+        _add_to_summary(ProductSalesSummary, ProductSalesSummary.product_id, product_id, orders=orders,
+                        quantity=quantity, revenue=revenue)
+
+    db.session.execute(delete(Order).where(Order.transaction_id.in_(ids)))
+    db.session.execute(delete(Transaction).where(Transaction.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+def archive_history(days, batch_size=1000):
+    """Archive every transaction older than ``days`` days in batches of ``batch_size``.
+
+    Small batches keep each write transaction (and the SQLite write lock)
+    short, so the store keeps serving while a large backlog is archived.
+    """
+    cutoff = datetime.now() - timedelta(days=days)
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
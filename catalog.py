@@ -0,0 +1,344 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from listing import ListingPage
+from models import db, Product
+
+SEP = '\x00'
+
+
+class CatalogSnapshot:
+    """Immutable, column-oriented copy of the product catalog for storefront filters.
+
+    Rows are kept in (category, price, id) order in typed arrays, so a category
+    is one contiguous block and a price range inside it is found with two
+    bisects. A running count of in-stock rows answers "in stock only" counts in
+    constant time and finds the n-th in-stock row with a bisect; stock changes
+    patched in after the build are kept as a short sorted list of corrections
+    on top of it. Names and
+    descriptions live lower-cased in a single string that text filters scan
+    with ``str.find``. Nothing here is an ORM object: only the page being
+    rendered is loaded from the database.
+    """
+
+    def __init__(self, rows):
+        # rows: (id, category_id, price, quantity, name, description) in (category_id, price, id) order
+        self.ids = array('q')
+        self.category_ids = array('q')
+        self.prices = array('d')
+        self.quantities = array('q')
+        # in_stock_before[i]: rows before row i with quantity > 0
+        self.in_stock_before = array('q', [0])
+        # offsets[i]: where row i's text starts in self.text
+        self.offsets = array('q')
+        # category_id -> (first row, end row)
+        self.blocks = {}
+        chunks = []
+        position = 0
+        in_stock = 0
+        for product_id, category_id, price, quantity, name, description in rows:
+            row = len(self.ids)
+            if category_id not in self.blocks:
+                self.blocks[category_id] = (row, row)
+            self.ids.append(product_id)
+            self.category_ids.append(category_id)
+            self.prices.append(price)
+            self.quantities.append(quantity)
+            in_stock += quantity > 0
+            self.in_stock_before.append(in_stock)
+            text = f'{name}{SEP}{description}{SEP}'.lower()
+            self.offsets.append(position)
+            chunks.append(text)
+            position += len(text)
+        self.offsets.append(position)
+        self.text = ''.join(chunks)
+        del chunks
+        self.blocks = {category_id: (start, self._block_end(start)) for category_id, (start, _) in self.blocks.items()}
+        self.category_counts = {category_id: end - start for category_id, (start, end) in self.blocks.items()}
+        # Rows whose in-stock state changed since the build, sorted, and the running
+        # sum of their corrections (+1 back in stock, -1 sold out) before each one
+        self.flips = ((), (0,))
+
+    @classmethod
+    def load(cls):
+        rows = db.session.execute(
+            select(Product.id, Product.category_id, Product.price, Product.quantity, Product.name, Product.description)
+            .order_by(Product.category_id, Product.price, Product.id)
+            .execution_options(yield_per=10000)
+        )
+        return cls(rows)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, product_id, category_id, price):
+        """Row of a product, located by its (category, price, id) sort key, or None."""
+        start, end = self.blocks.get(category_id, (0, 0))
+        row = bisect_left(self.prices, price, start, end)
+        while row < end and self.prices[row] == price:
+            if self.ids[row] == product_id:
+                return row
+            row += 1
+        return None
+
+    def _block_end(self, start):
+        return bisect_right(self.category_ids, self.category_ids[start], start)
+
+    def _ranges(self, category_id, min_price, max_price):
+        """Row ranges matching the category and price filters, in display order."""
+        if category_id is None:
+            blocks = self.blocks.values()
+        else:
+            blocks = [self.blocks[category_id]] if category_id in self.blocks else []
+        for start, end in blocks:
+            lo = start if min_price is None else bisect_left(self.prices, min_price, start, end)
+            hi = end if max_price is None else bisect_right(self.prices, max_price, lo, end)
+            if lo < hi:
+                yield lo, hi
+
+    def set_quantity(self, row, quantity):
+        """Patch one row's stock in place; returns how many rows now differ from the build."""
+        flipped = (self.quantities[row] > 0) != (quantity > 0)
+        self.quantities[row] = quantity
+        if flipped:
+            # A row that flips back is in its built state again
+            rows = tuple(sorted(set(self.flips[0]) ^ {row}))
+            corrections = [0]
+            for r in rows:
+                corrections.append(corrections[-1] + (1 if self.quantities[r] > 0 else -1))
+            # One assignment, so a search sees either the old corrections or the new ones
+            self.flips = (rows, tuple(corrections))
+        return len(self.flips[0])
+
+    def _in_stock_before(self, row, flips):
+        rows, corrections = flips
+        return self.in_stock_before[row] + corrections[bisect_left(rows, row)]
+
+    def _count(self, lo, hi, in_stock, flips):
+        if not in_stock:
+            return hi - lo
+        return self._in_stock_before(hi, flips) - self._in_stock_before(lo, flips)
+
+    def _take(self, lo, hi, in_stock, skip, limit, flips):
+        """Rows ``skip`` to ``skip + limit`` of a range."""
+        if not in_stock:
+            return range(lo + skip, min(hi, lo + skip + limit))
+        # Last row with at most (in-stock rows before lo) + skip in-stock rows before it
+        target = self._in_stock_before(lo, flips) + skip
+        if not flips[0]:
+            row = bisect_right(self.in_stock_before, target, lo, hi + 1) - 1
+        else:
+            left, right = lo, hi + 1
+            while left < right:
+                middle = (left + right) // 2
+                if self._in_stock_before(middle, flips) <= target:
+                    left = middle + 1
+                else:
+                    right = middle
+            row = left - 1
+        rows = []
+        while row < hi and len(rows) < limit:
+            if self.quantities[row] > 0:
+                rows.append(row)
+            row += 1
+        return rows
+
+    def _text_rows(self, text, lo, hi, in_stock):
+        """Rows in a range whose name or description contains ``text``."""
+        position, end = self.offsets[lo], self.offsets[hi]
+        while True:
+            position = self.text.find(text, position, end)
+            if position < 0:
+                return
+            row = bisect_right(self.offsets, position, lo, hi) - 1
+            if not in_stock or self.quantities[row] > 0:
+                yield row
+            position = self.offsets[row + 1]
+
+    def search(self, text=None, category_id=None, min_price=None, max_price=None, in_stock=False,
+               offset=0, limit=24, count_cap=10000):
+        """Product ids for one page of matches, the total and whether it was capped.
+
+        Without a text filter the total is exact and costs one bisect per
+        category. With one, matches have to be found by scanning, so counting
+        stops after ``count_cap`` like the admin listings do.
+        """
+        text = text.lower().replace(SEP, '') if text else None
+        flips = self.flips
+        rows = []
+        total = 0
+        for lo, hi in self._ranges(category_id, min_price, max_price):
+            if text:
+                for row in self._text_rows(text, lo, hi, in_stock):
+                    if offset <= total < offset + limit:
+                        rows.append(row)
+                    total += 1
+                    if total > count_cap and total > offset + limit:
+                        return [self.ids[r] for r in rows], count_cap, True
+            else:
+                count = self._count(lo, hi, in_stock, flips)
+                if len(rows) < limit and total + count > offset:
+                    rows.extend(self._take(lo, hi, in_stock, max(0, offset - total), limit - len(rows), flips))
+                total += count
+        return [self.ids[r] for r in rows], total, False
+
+    def memory_bytes(self):
+        """Approximate footprint of the snapshot."""
+        size = sys.getsizeof(self.text) + sys.getsizeof(self.blocks) + sys.getsizeof(self.category_counts)
+        for column in (self.ids, self.category_ids, self.prices, self.quantities, self.in_stock_before, self.offsets):
+            size += sys.getsizeof(column)
+        return size
+
+
+class Catalog:
+    """Storefront product filtering served from a :class:`CatalogSnapshot`.
+
+    The snapshot is built from the database on first use and replaced as a
+    whole: a new one is built in a background thread and swapped in with a
+    single assignment, so a request always filters one consistent snapshot.
+    Admin catalog writes call :meth:`invalidate`; purchases call
+    :meth:`stock_changed`, which patches the snapshot in place. Other worker
+    processes catch up after ``rebuild_seconds``. Pages are hydrated from the database, so the prices
+    and stock shown are always live.
+    """
+
+    def __init__(self, per_page=24, max_per_page=96, count_cap=10000, rebuild_seconds=300, max_flips=1000):
+        self.per_page = per_page
+        self.max_per_page = max_per_page
+        self.count_cap = count_cap
+        self.rebuild_seconds = rebuild_seconds
+        self.max_flips = max_flips
+        self.snapshot = None
+        self.built_at = 0
+        self.changes = 0
+        # product_id -> (seq, category_id, price, quantity) of purchases patched into the snapshot
+        self.patches = {}
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.rebuilding = False
+
+    def rebuild(self):
+        started = self.seq
+        snapshot = CatalogSnapshot.load()
+        with self.lock:
+            # Purchases that committed while this snapshot was loading may be missing from it
+            for product_id, (seq, category_id, price, quantity) in self.patches.items():
+                row = snapshot.find(product_id, category_id, price) if seq > started else None
+                if row is not None:
+                    snapshot.set_quantity(row, quantity)
+            self.patches = {k: v for k, v in self.patches.items() if v[0] > started}
+            self.snapshot = snapshot
+            self.built_at = time.monotonic()
+        return snapshot
+
+    def _rebuild_in_background(self, app):
+        def run():
+            try:
+                with app.app_context():
+                    while True:
+                        started = self.changes
+                        self.rebuild()
+                        db.session.remove()
+                        # Build again if the catalog changed while this snapshot was loading. Checked
+                        # under the lock so an invalidate() landing now either sees rebuilding=False
+                        # and starts a build itself, or is picked up by this loop.
+                        with self.lock:
+                            if self.changes == started:
+                                self.rebuilding = False
+                                return
+            except BaseException:
+                with self.lock:
+                    self.rebuilding = False
+                raise
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=run, daemon=True).start()
+
+    def invalidate(self):
+        with self.lock:
+            self.changes += 1
+        if self.snapshot is not None:
+            self._rebuild_in_background(current_app._get_current_object())
+
+    def stock_changed(self, products):
+        """Called after a purchase commits with (id, category_id, price, quantity) of each product.
+
+        The snapshot's quantities only decide "in stock only" filtering.
+        Each product's row is found with a bisect and its quantity patched in
+        place; a sell-out adds one entry to the snapshot's list of in-stock
+        corrections. The snapshot is only rebuilt once that list passes
+        ``max_flips``, or for a product that is not where the snapshot expects
+        it.
+        """
+        if self.snapshot is None:
+            return
+        stale = False
+        with self.lock:
+            snapshot = self.snapshot
+            for product_id, category_id, price, quantity in products:
+                self.seq += 1
+                self.patches[product_id] = (self.seq, category_id, price, quantity)
+                row = snapshot.find(product_id, category_id, price)
+                if row is None or snapshot.set_quantity(row, quantity) > self.max_flips:
+                    stale = True
+        if stale:
+            self.invalidate()
+
+    def current(self):
+        if self.snapshot is None:
+            return self.rebuild()
+        if not self.rebuilding and time.monotonic() - self.built_at > self.rebuild_seconds:
+            self._rebuild_in_background(current_app._get_current_object())
+        return self.snapshot
+
+    def category_counts(self):
+        return self.current().category_counts
+
+    def _number_arg(self, args, name, kind):
+        try:
+            return kind(args.get(name, ''))
+        except ValueError:
+            return None
+
+    def page(self, args):
+        """One page of storefront results for the ``q``/``category``/price/``in_stock`` args."""
+        try:
+            page = min(max(int(args.get('page', 1)), 1), 10 ** 6)
+        except ValueError:
+            page = 1
+        try:
+            per_page = min(max(int(args.get('per_page', self.per_page)), 1), self.max_per_page)
+        except ValueError:
+            per_page = self.per_page
+
+        filters = {name: args.get(name, '').strip() for name in ('q', 'category', 'min_price', 'max_price', 'in_stock')}
+        ids, total, capped = self.current().search(
+            text=filters['q'],
+            category_id=self._number_arg(args, 'category', int),
+            min_price=self._number_arg(args, 'min_price', float),
+            max_price=self._number_arg(args, 'max_price', float),
+            in_stock=bool(filters['in_stock']),
+            offset=(page - 1) * per_page,
+            limit=per_page,
+            count_cap=self.count_cap,
+        )
+
+        found = {}
+        if ids:
+            found = {p.id: p for p in db.session.execute(
+                select(Product).where(Product.id.in_(ids)).options(joinedload(Product.category))
+            ).scalars()}
+        items = [found[i] for i in ids if i in found]
+        has_next = capped or total > page * per_page
+        return ListingPage(self, items, page, per_page, None, None, {k: v for k, v in filters.items() if v},
+                           total, capped, has_next)
+
+
+catalog = Catalog()
@@ -0,0 +1,550 @@
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from http.client import HTTPConnection
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, User, Category, Product, Transaction, Order
+from ratelimit import MemoryBackend, SQLiteBackend, limiter
+from recommendations import recommender
+from suggest import PRODUCT, SuggestIndex, Suggester
+from inventory_stream import broker, record_change
+from archive import archive_history
+from catalog import CatalogSnapshot, catalog
+from query_audit import audit_hot_paths
+
+def _per_call_us(fn, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+@click.command('bench-ratelimit')
+@click.option('-n', '--requests', default=5000, help='Calls per measurement.')
+@with_appcontext
+def bench_ratelimit(requests):
+    """Measure the per-request overhead of the rate limiter."""
+    memory = MemoryBackend()
+    click.echo(f'memory backend:  {_per_call_us(lambda i: memory.consume(f"k{i % 100}", 1e9, 1e9), requests):8.2f} us/check')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = SQLiteBackend(os.path.join(tmp, 'ratelimit.sqlite3'))
+        click.echo(f'sqlite backend:  {_per_call_us(lambda i: shared.consume(f"k{i % 100}", 1e9, 1e9), requests):8.2f} us/check')
+        shared.local.conn.close()
+
+    # Whole request through the test client, with and without admission control
+    app = current_app._get_current_object()
+    client = app.test_client()
+    saved = limiter.rules, limiter.semaphore, app.config['RATELIMIT_ENABLED']
+    try:
+        app.config['RATELIMIT_ENABLED'] = False
+        limiter.semaphore = None
+        _per_call_us(lambda i: client.get('/login'), 200)  # warm up
+        baseline = _per_call_us(lambda i: client.get('/login'), requests)
+
+        app.config['RATELIMIT_ENABLED'] = True
+        limiter.rules = {'main.login': (1e9, 1e9)}
+        limiter.semaphore = saved[1]
+        limited = _per_call_us(lambda i: client.get('/login'), requests)
+    finally:
+        limiter.rules, limiter.semaphore, app.config['RATELIMIT_ENABLED'] = saved
+    click.echo(f'GET /login without limiter: {baseline:8.2f} us/request')
+    click.echo(f'GET /login with limiter:    {limited:8.2f} us/request ({limited - baseline:+.2f} us)')
+
+@contextmanager
+def _scratch_app():
+    """A throwaway app on a temporary SQLite file, so benchmarks never touch real data."""
+    from app import create_app
+    from config import Config
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class ScratchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp}/bench.sqlite3'
+            RATELIMIT_ENABLED = False
+
+        app = create_app(ScratchConfig)
+        with app.app_context():
+            try:
+                yield app
+            finally:
+                db.session.remove()
+                db.engine.dispose()
+
+def _seed(products, transactions=0, basket=4, categories=20, users=100, seed=42):
+    """Bulk-insert a synthetic catalog and purchase history."""
+    rng = random.Random(seed)
+    db.session.execute(db.insert(Category), [{'id': i, 'name': f'Category {i}'} for i in range(1, categories + 1)])
+    db.session.execute(db.insert(User), [
+        {'id': i, 'username': f'user{i}', 'passhash': '-', 'email': f'user{i}@example.com', 'is_admin': False}
+        for i in range(2, users + 2)
+    ])
+    db.session.execute(db.insert(Product), [
+        {'id': i, 'name': f'Product {i}', 'price': rng.randint(1, 1000), 'description': f'Description of product {i}',
+         'category_id': rng.randint(1, categories), 'quantity': rng.randint(0, 100), 'man_date': date(2024, 1, 1)}
+        for i in range(1, products + 1)
+    ])
+    start = datetime(2020, 1, 1)
+    if transactions:
+        db.session.execute(db.insert(Transaction), [
+            {'id': i, 'user_id': rng.randint(2, users + 1), 'datetime': start + timedelta(minutes=i)}
+            for i in range(1, transactions + 1)
+        ])
+    orders = []
+    for transaction_id in range(1, transactions + 1):
+        # Skewed picks so some products are bought together far more often than others
+        basket_ids = {int(rng.paretovariate(1.2)) % products + 1 if rng.random() < 0.5 else rng.randint(1, products)
+                      for _ in range(basket)}
+        orders.extend({'transaction_id': transaction_id, 'product_id': pid, 'quantity': 1, 'price': 10.0}
+                      for pid in basket_ids)
+    if orders:
+        db.session.execute(db.insert(Order), orders)
+    db.session.commit()
+
+@click.command('rebuild-recommendations')
+@with_appcontext
+def rebuild_recommendations():
+    """Recompute the frequently-bought-together matrix from order history."""
+    start = time.perf_counter()
+    pairs = recommender.rebuild()
+    click.echo(f'Rebuilt {pairs} product pairs in {time.perf_counter() - start:.2f}s')
+
+@click.command('bench-recommendations')
+@click.option('--products', default=10000)
+@click.option('--transactions', default=50000)
+@click.option('--basket', default=4, help='Products per transaction.')
+@click.option('-n', '--lookups', default=2000)
+def bench_recommendations(products, transactions, basket, lookups):
+    """Measure recommendation build time and lookup latency on synthetic orders."""
+    with _scratch_app():
+        _seed(products, transactions, basket)
+        start = time.perf_counter()
+        pairs = recommender.rebuild()
+        click.echo(f'full rebuild: {pairs} pairs from {transactions} transactions in {time.perf_counter() - start:.2f}s')
+
+        rng = random.Random(1)
+        ids = [int(rng.paretovariate(1.2)) % products + 1 for _ in range(lookups)]
+        click.echo(f'incremental update: {_per_call_us(lambda i: recommender.record_purchase(ids[i:i + basket]), 200):8.1f} us/purchase')
+
+        recommender.invalidate()
+        click.echo(f'product lookup, cold: {_per_call_us(lambda i: recommender.for_product(ids[i]), lookups):8.1f} us')
+        click.echo(f'product lookup, warm: {_per_call_us(lambda i: recommender.for_product(ids[i]), lookups):8.1f} us')
+        click.echo(f'cart lookup ({basket} items), warm: {_per_call_us(lambda i: recommender.for_cart(ids[i:i + basket]), lookups):8.1f} us')
+        recommender.invalidate()
+
+_WORDS = ['amul', 'fresh', 'organic', 'basmati', 'rice', 'milk', 'paneer', 'atta', 'masala', 'tea', 'coffee',
+          'sugar', 'salt', 'dal', 'toor', 'moong', 'chana', 'ghee', 'butter', 'biscuit', 'soap', 'shampoo',
+          'oil', 'mustard', 'sunflower', 'bread', 'curd', 'honey', 'jam', 'noodles', 'namkeen', 'chips']
+
+@click.command('bench-suggest')
+@click.option('--names', default=1000000)
+@click.option('-n', '--lookups', default=20000)
+def bench_suggest(names, lookups):
+    """Measure typeahead build time, memory and lookup latency on synthetic names."""
+    rng = random.Random(7)
+    records = [(PRODUCT, i, ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(2, 4))) + f' {rng.randint(1, 999)}g',
+                int(rng.paretovariate(1.5))) for i in range(1, names + 1)]
+
+    start = time.perf_counter()
+    suggester = Suggester()
+    suggester.index = SuggestIndex(records, top_n=suggester.top_n)
+    suggester.built_at = time.monotonic()
+    build = time.perf_counter() - start
+    index = suggester.index
+    click.echo(f'build: {names} names, {len(index.keys)} keys, {len(index.heavy)} precomputed prefixes in {build:.1f}s')
+    footprint = index.memory_bytes()
+    click.echo(f'memory: ~{footprint / 2 ** 20:.1f} MiB held by the index ({footprint / names:.0f} B/name)')
+
+    prefixes = []
+    for _ in range(lookups):
+        name = records[rng.randrange(names)][2]
+        prefixes.append(name[:rng.randint(1, min(8, len(name)))])
+    timings = []
+    for prefix in prefixes:
+        t = time.perf_counter()
+        suggester.suggest(prefix, 10)
+        timings.append(time.perf_counter() - t)
+    timings.sort()
+    click.echo(f'lookup: mean {sum(timings) / len(timings) * 1e6:.1f} us, '
+               f'p50 {timings[len(timings) // 2] * 1e6:.1f} us, p99 {timings[int(len(timings) * 0.99)] * 1e6:.1f} us, '
+               f'max {timings[-1] * 1e6:.1f} us')
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return 0
+
+@click.command('bench-inventory-stream')
+@click.option('--subscribers', default=500)
+@click.option('--events', default=20)
+def bench_inventory_stream(subscribers, events):
+    """Open many SSE subscribers and measure memory per connection and delivery latency."""
+    import threading
+    import tracemalloc
+
+    with _scratch_app() as app:
+        _seed(products=100)
+        broker.max_subscribers = max(broker.max_subscribers, subscribers)
+        committed = {}
+        received = []
+        connected = threading.Barrier(subscribers + 1)
+        lock = threading.Lock()
+
+        def subscriber():
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+            response = client.get('/api/stream/inventory', buffered=False)
+            connected.wait()
+            seen = 0
+            for chunk in response.iter_encoded():
+                if chunk.startswith(b'id: '):
+                    event_id = int(chunk[4:chunk.index(b'\n')])
+                    with lock:
+                        received.append((event_id, time.perf_counter()))
+                    seen += 1
+                    if seen == events:
+                        break
+            response.close()
+
+        tracemalloc.start()
+        heap_before, rss_before = tracemalloc.get_traced_memory()[0], _rss_bytes()
+        threads = [threading.Thread(target=subscriber, daemon=True) for _ in range(subscribers)]
+        for thread in threads:
+            thread.start()
+        connected.wait()
+        heap_after, rss_after = tracemalloc.get_traced_memory()[0], _rss_bytes()
+        tracemalloc.stop()
+        click.echo(f'{subscribers} subscribers connected: '
+                   f'{(heap_after - heap_before) / subscribers / 1024:.1f} KiB Python heap, '
+                   f'{(rss_after - rss_before) / subscribers / 1024:.1f} KiB RSS per connection '
+                   f'(includes the test client side and thread stacks)')
+
+        for i in range(events):
+            product = db.session.get(Product, i % 100 + 1)
+            product.quantity += 1
+            change = record_change(product)
+            db.session.flush()
+            committed[change.id] = time.perf_counter()
+            db.session.commit()
+            time.sleep(0.01)
+        # One deadline for all of them, not a timeout per thread
+        deadline = time.monotonic() + 30
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        stuck = sum(thread.is_alive() for thread in threads)
+        if stuck:
+            click.echo(f'{stuck} subscribers had not received every event after 30 s')
+
+        latencies = sorted((at - committed[event_id]) * 1e3 for event_id, at in received if event_id in committed)
+        if latencies:
+            click.echo(f'delivered {len(latencies)}/{subscribers * events} events: '
+                       f'p50 {latencies[len(latencies) // 2]:.2f} ms, p99 {latencies[int(len(latencies) * 0.99)]:.2f} ms, '
+                       f'max {latencies[-1]:.2f} ms')
+
+@click.command('bench-bulk-fetch')
+@click.option('--objects', default=100)
+@click.option('--rounds', default=20)
+@click.option('--rtt-ms', default=0.0, help='Network round trip to add per HTTP call when reporting.')
+def bench_bulk_fetch(objects, rounds, rtt_ms):
+    """Compare fetching N products one call at a time, with ids= and through /api/batch."""
+    with _scratch_app() as app:
+        _seed(products=max(1000, objects))
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        ids = random.Random(3).sample(range(1, max(1000, objects) + 1), objects)
+
+        def individual(_):
+            for product_id in ids:
+                client.get(f'/api/products/{product_id}')
+
+        def bulk(_):
+            client.get('/api/products?ids=' + ','.join(map(str, ids)))
+
+        def batched(_):
+            for start in range(0, objects, 50):
+                client.post('/api/batch', json={'requests': [{'path': f'/api/products/{i}'} for i in ids[start:start + 50]]})
+
+        calls = {'individual': objects, 'ids=': 1, 'batch': -(-objects // 50)}
+        for label, fn in (('individual', individual), ('ids=', bulk), ('batch', batched)):
+            fn(0)  # warm up
+            ms = _per_call_us(fn, rounds) / 1000
+            click.echo(f'{objects} products, {label:>10}: {calls[label]:4d} calls, {ms:8.2f} ms server time'
+                       + (f', {ms + calls[label] * rtt_ms:8.2f} ms with {rtt_ms} ms RTT' if rtt_ms else ''))
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _get(port, path, cookie):
+    conn = HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('GET', path, headers={'Cookie': cookie})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+@contextmanager
+def _serve(database_uri, workers, warm=True):
+    """Run serve.py in a subprocess; yields (port, seconds until /readyz answered)."""
+    port = _free_port()
+    env = dict(os.environ, APP_ENV='production', DATABASE_URL=database_uri,
+               RATELIMIT_ENABLED='False', MAX_CONCURRENT_REQUESTS='0')
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py'),
+               '--bind', f'127.0.0.1:{port}', '--workers', str(workers)]
+    if not warm:
+        command.append('--no-warmup')
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise click.ClickException('serve.py exited during startup')
+            try:
+                if _get(port, '/readyz', '') == 200:
+                    break
+            except OSError:
+                time.sleep(0.02)
+        yield port, time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+
+@click.command('bench-serve')
+@click.option('--products', default=100000)
+@click.option('--workers', default=4, help='Workers for the throughput run (compared with 1).')
+@click.option('--threads', default=16, help='Concurrent client connections.')
+@click.option('--seconds', default=5.0, help='Duration of each throughput run.')
+def bench_serve(products, workers, threads, seconds):
+    """Cold vs warm first-request latency and throughput of serve.py with 1 and N workers."""
+    with _scratch_app() as app:
+        _seed(products=products, transactions=products // 2)
+        database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+        cookie = 'session=' + app.session_interface.get_signing_serializer(app).dumps({'user_id': 1})
+        db.session.remove()
+        db.engine.dispose()
+
+        for warm in (False, True):
+            with _serve(database_uri, 1, warm) as (port, startup):
+                timings = []
+                for path in ('/login', '/api/products/suggest?q=pro', '/api/products/suggest?q=prod'):
+                    t = time.perf_counter()
+                    _get(port, path, cookie)
+                    timings.append((time.perf_counter() - t) * 1000)
+            click.echo(f'{"warm" if warm else "cold"}: ready after {startup:5.2f}s, first /login {timings[0]:7.1f} ms, '
+                       f'first suggest {timings[1]:7.1f} ms, next suggest {timings[2]:5.1f} ms')
+
+        if os.cpu_count() and workers > os.cpu_count():
+            click.echo(f'note: {workers} workers on {os.cpu_count()} CPU(s); expect little scaling')
+        for count in sorted({1, workers}):
+            with _serve(database_uri, count) as (port, _):
+                done = []
+                deadline = time.perf_counter() + seconds
+
+                def client(seed):
+                    rng = random.Random(seed)
+                    n = 0
+                    while time.perf_counter() < deadline:
+                        _get(port, f'/api/products/{rng.randint(1, products)}', cookie)
+                        n += 1
+                    done.append(n)
+
+                clients = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+                for thread in clients:
+                    thread.start()
+                for thread in clients:
+                    thread.join()
+            click.echo(f'{count} worker(s), {threads} connections: {sum(done) / seconds:8.1f} req/s')
+
+def _percentiles_ms(timings):
+    timings = sorted(timings)
+    return (f'mean {sum(timings) / len(timings) * 1000:7.2f} ms, p50 {timings[len(timings) // 2] * 1000:7.2f} ms, '
+            f'p99 {timings[int(len(timings) * 0.99)] * 1000:7.2f} ms')
+
+@click.command('bench-catalog')
+@click.option('--products', default=1000000)
+@click.option('-n', '--queries', default=200)
+@click.option('--per-page', default=24)
+def bench_catalog(products, queries, per_page):
+    """Memory per product and storefront filter latency: catalog snapshot vs ORM queries."""
+    import tracemalloc
+    from sqlalchemy import select
+
+    with _scratch_app():
+        start = time.perf_counter()
+        db.session.execute(db.insert(Category), [{'id': i, 'name': f'Category {i}'} for i in range(1, 21)])
+        for first in range(0, products, 200000):
+            # Seed in chunks to keep the insert parameters small
+            rng = random.Random(first)
+            db.session.execute(db.insert(Product), [
+                {'id': i, 'name': ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(2, 4))) + f' {i}',
+                 'price': rng.randint(1, 1000), 'description': f'{rng.choice(_WORDS)} {rng.choice(_WORDS)}',
+                 'category_id': rng.randint(1, 20), 'quantity': rng.choice((0, 0, 5, 20, 100)), 'man_date': date(2024, 1, 1)}
+                for i in range(first + 1, min(first + 200000, products) + 1)
+            ])
+            db.session.commit()
+        click.echo(f'seeded {products} products in {time.perf_counter() - start:.1f}s')
+
+        start = time.perf_counter()
+        snapshot = CatalogSnapshot.load()
+        click.echo(f'snapshot build: {time.perf_counter() - start:.2f}s')
+        footprint = snapshot.memory_bytes()
+        click.echo(f'snapshot memory: {footprint / 2 ** 20:.1f} MiB ({footprint / products:.0f} B/product)')
+
+        sample = min(products, 20000)
+        db.session.expunge_all()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        loaded = db.session.execute(select(Product).limit(sample)).scalars().all()
+        orm_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        click.echo(f'ORM objects:     {orm_bytes / len(loaded):.0f} B/product (measured on {len(loaded)}), '
+                   f'~{orm_bytes / len(loaded) * products / 2 ** 20:.0f} MiB for the whole catalog')
+        del loaded
+        db.session.expunge_all()
+
+        rng = random.Random(9)
+        filters = []
+        for _ in range(queries):
+            low = rng.randint(1, 900)
+            filters.append({
+                'text': rng.choice((None, None, rng.choice(_WORDS))),
+                'category_id': rng.choice((None, rng.randint(1, 20))),
+                'min_price': rng.choice((None, low)),
+                'max_price': rng.choice((None, low + rng.randint(10, 100))),
+                'in_stock': rng.random() < 0.5,
+            })
+
+        timings = []
+        for f in filters:
+            t = time.perf_counter()
+            ids, _, _ = snapshot.search(**f, limit=per_page)
+            if ids:
+                db.session.execute(select(Product).where(Product.id.in_(ids))).scalars().all()
+            timings.append(time.perf_counter() - t)
+            db.session.expunge_all()
+        click.echo(f'snapshot filter + page hydration: {_percentiles_ms(timings)}')
+
+        def criteria(f):
+            where = []
+            if f['text']:
+                where.append(Product.name.contains(f['text']) | Product.description.contains(f['text']))
+            if f['category_id'] is not None:
+                where.append(Product.category_id == f['category_id'])
+            if f['min_price'] is not None:
+                where.append(Product.price >= f['min_price'])
+            if f['max_price'] is not None:
+                where.append(Product.price <= f['max_price'])
+            if f['in_stock']:
+                where.append(Product.quantity > 0)
+            return where
+
+        timings = []
+        for f in filters[:max(1, queries // 10)]:
+            t = time.perf_counter()
+            db.session.execute(select(Product).where(*criteria(f))).scalars().all()
+            timings.append(time.perf_counter() - t)
+            db.session.expunge_all()
+        click.echo(f'ORM, every match hydrated ({len(timings)} queries): {_percentiles_ms(timings)}')
+
+@click.command('audit-indexes')
+@click.option('--products', default=2000)
+@click.option('--transactions', default=5000)
+@click.option('-v', '--verbose', is_flag=True, help='Print the plan of every query, not only the flagged ones.')
+def audit_indexes(products, transactions, verbose):
+    """Replay the hot paths on a scratch database and flag full table scans in their query plans.
+
+    Exits with status 1 when a scan is found, so it can run as a CI check.
+    """
+    from suggest import suggester
+
+    with _scratch_app() as app:
+        _seed(products=products, transactions=transactions)
+        # Build the in-memory caches first so only per-request queries are audited
+        recommender.rebuild()
+        catalog.rebuild()
+        suggester.rebuild()
+        db.session.remove()
+
+        results = audit_hot_paths(app)
+        flagged = 0
+        for label, statement, plan, scans in results:
+            if scans:
+                flagged += 1
+            if scans or verbose:
+                click.echo(f'[{"SCAN " + ", ".join(scans) if scans else "ok"}] {label}: {" ".join(statement.split())}')
+                for detail in plan:
+                    click.echo(f'    {detail}')
+        click.echo(f'{len(results)} queries on {len({r[0] for r in results})} hot paths, {flagged} with full table scans')
+        if flagged:
+            raise click.ClickException('full table scans on hot paths; add an index or adjust the query')
+
+@click.command('archive-history')
+@click.option('--days', type=int, default=None, help='Archive transactions older than this (default ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, default=None)
+@with_appcontext
+def archive_history_command(days, batch_size):
+    """Move old transactions and their orders into the archive tables and prune the inventory change log."""
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    start = time.perf_counter()
+    moved = archive_history(days, batch_size)
+    click.echo(f'Archived {moved} transactions older than {days} days in {time.perf_counter() - start:.2f}s')
+    retention = current_app.config['INVENTORY_LOG_RETENTION_DAYS']
+    pruned = broker.prune(datetime.now() - timedelta(days=retention))
+    click.echo(f'Pruned {pruned} inventory changes older than {retention} days')
+
+@click.command('check-archive')
+def check_archive():
+    """Archive a scratch history completely, buy again, archive again: ids must never collide."""
+    from models import ArchivedTransaction, ArchivedOrder
+
+    with _scratch_app() as app:
+        _seed(products=50, transactions=100)
+        archive_history(0)
+        if Transaction.query.count():
+            raise click.ClickException('the hot transaction table was not drained')
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 2
+        product = Product.query.filter(Product.quantity > 0).first()
+        client.post(f'/add_to_cart/{product.id}', data={'quantity': '1'})
+        client.post('/buy')
+        transaction = Transaction.query.one()
+        if db.session.get(ArchivedTransaction, transaction.id) or any(
+                db.session.get(ArchivedOrder, order.id) for order in transaction.orders):
+            raise click.ClickException(f'transaction {transaction.id} reuses an archived id')
+
+        new_id = transaction.id
+        transaction.datetime = datetime.now() - timedelta(days=1)
+        db.session.commit()
+        archive_history(0)
+        click.echo(f'ok: {ArchivedTransaction.query.count()} transactions archived across two drains, '
+                   f'new ids continue at {new_id}')
+
+def register_commands(app):
+    app.cli.add_command(bench_ratelimit)
+    app.cli.add_command(rebuild_recommendations)
+    app.cli.add_command(bench_recommendations)
+    app.cli.add_command(bench_suggest)
+    app.cli.add_command(bench_inventory_stream)
+    app.cli.add_command(bench_bulk_fetch)
+    app.cli.add_command(archive_history_command)
+    app.cli.add_command(check_archive)
+    app.cli.add_command(bench_serve)
+    app.cli.add_command(bench_catalog)
+    app.cli.add_command(audit_indexes)
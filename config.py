@@ -9,6 +9,36 @@ class Config:
     # Provide a development fallback if SECRET_KEY is not set in the environment
     SECRET_KEY = os.getenv('SECRET_KEY') or 'dev-secret-key'
     SQLALCHEMY_TRACK_MODIFICATIONS = os.getenv('SQLALCHEMY_TRACK_MODIFICATIONS') == 'True'
+
+    # Rate limiting: 'memory' (one process) or 'sqlite:///path' (shared by all workers)
+    RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'True') == 'True'
+    RATELIMIT_STORAGE = os.getenv('RATELIMIT_STORAGE', 'memory')
+    # Number of reverse proxies in front of the app whose X-Forwarded-For is trusted
+    # for per-IP limits; 0 uses the socket address (the proxy's, when there is one)
+    RATELIMIT_TRUSTED_PROXIES = int(os.getenv('RATELIMIT_TRUSTED_PROXIES', '0'))
+    # endpoint or blueprint -> (tokens per second, burst), per user and per IP
+    RATELIMIT_RULES = {
+        'main.search': (5, 20),
+        'main.add_to_cart': (2, 10),
+        'main.buy': (0.2, 3),
+        'api.get_products': (2, 10),
+        'api.suggest_products': (20, 60),
+        # A batch carries up to 50 sub-requests, which are not charged again: ~10 calls/s like 'api'
+        'api.batch': (0.2, 2),
+        'api': (10, 50),
+    }
+    # Requests a worker serves at once before it sheds load with 503 (0 = no cap)
+    MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', '32'))
+    CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv('CONCURRENCY_QUEUE_TIMEOUT', '0.05'))
+    # Long-lived streams would hold a slot for their whole lifetime
+    CONCURRENCY_EXEMPT_ENDPOINTS = {'api.stream_inventory', 'health.healthz', 'health.readyz'}
+
+    # Transactions older than this are moved to the archive tables by `flask archive-history`
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '1000'))
+    # The same command prunes the inventory change log behind /api/stream/inventory;
+    # clients that reconnect from further back get a "reset" event
+    INVENTORY_LOG_RETENTION_DAYS = int(os.getenv('INVENTORY_LOG_RETENTION_DAYS', '7'))
     # Add other universal settings here
 
 class DevelopmentConfig(Config):
@@ -20,4 +50,16 @@ class ProductionConfig(Config):
     """Production-specific configuration."""
     DEBUG = False
     # In production, you'd use a real DB like PostgreSQL
-    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
\ No newline at end of file
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL') or os.getenv('SQLALCHEMY_DATABASE_URI')
+
+config_by_name = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+}
+
+def config_from_env(default='development'):
+    """Pick the config class named by APP_ENV (development or production)."""
+    name = os.getenv('APP_ENV', default)
+    if name not in config_by_name:
+        raise ValueError(f"Unknown APP_ENV {name!r}; expected one of: {', '.join(sorted(config_by_name))}")
+    return config_by_name[name]
\ No newline at end of file
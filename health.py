@@ -0,0 +1,23 @@
+import os
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from models import db
+
+health = Blueprint('health', __name__)
+
+# Liveness: the process is up and serving requests
+@health.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+# Readiness: warmed up, not shutting down, and the database answers
+@health.route('/readyz')
+def readyz():
+    if not current_app.extensions.get('ready', True):
+        return jsonify({'status': 'not ready', 'pid': os.getpid()}), 503
+    try:
+        db.session.execute(text('SELECT 1'))
+    except SQLAlchemyError:
+        return jsonify({'status': 'database unavailable', 'pid': os.getpid()}), 503
+    return jsonify({'status': 'ready', 'pid': os.getpid()})
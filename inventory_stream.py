@@ -0,0 +1,262 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.orm import Session
+from models import db, InventoryChange
+
+def record_change(product, kind='updated'):
+    """Log a stock/price change in the current transaction; subscribers are
+    woken once the transaction commits."""
+    change = InventoryChange(product_id=product.id, event=kind, name=product.name, price=product.price,
+                             quantity=product.quantity, datetime=datetime.now())
+    db.session.add(change)
+    db.session.info['inventory_changed'] = True
+    return change
+
+def change_to_dict(change):
+    return {
+        'id': change.id,
+        'product_id': change.product_id,
+        'event': change.event,
+        'name': change.name,
+        'price': change.price,
+        'quantity': change.quantity,
+        'datetime': change.datetime.isoformat()
+    }
+
+def format_event(payload):
+    return f"id: {payload['id']}\nevent: {payload['event']}\ndata: {json.dumps(payload)}\n\n"
+
+@event.listens_for(Session, 'after_commit')
+def _wake_reader_on_commit(session):
+    if session.info.pop('inventory_changed', False):
+        broker.wake()
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_rolled_back_changes(session):
+    session.info.pop('inventory_changed', None)
+
+
+class Subscriber:
+    def __init__(self, max_queue, start, replay_until, gaps):
+        # Payloads queued by the broker's reader, in the order it read them
+        self.queue = queue.Queue(max_queue)
+        # The reader queues changes after ``start``; the stream reads the
+        # table itself up to ``replay_until`` (a resume, or after an overflow)
+        self.start = start
+        self.replay_until = replay_until
+        # Ids that were still uncommitted when the replay range was fixed:
+        # the reader may queue them later, after the replay found them
+        self.replay_gaps = gaps
+        self.overflowed = False
+        # Late (gap-filling) changes dropped while overflowed; replayed by id
+        self.dropped = set()
+
+
+class InventoryBroker:
+    """Fan-out of committed inventory changes to Server-Sent Events streams.
+
+    One reader thread per process reads the InventoryChange table in id
+    order and queues each change for every subscriber, so a commit costs one
+    query however many streams are open. Commits in this process wake the
+    reader straight away; it also reads on every heartbeat, which picks up
+    changes committed by other worker processes. Ids are allocated before
+    commit, so a change can become visible after a higher id was already
+    read; skipped ids are kept as gaps and looked for again until
+    ``gap_timeout`` passes, after which they are taken to be rolled back.
+
+    Each subscriber has a bounded queue. A subscriber that falls behind far
+    enough to fill it is skipped by the reader until it has caught up from
+    the table itself; so is a client resuming from an older Last-Event-ID.
+    """
+
+    def __init__(self, max_queue=256, max_subscribers=1000, heartbeat=15, replay_batch=500, gap_timeout=5,
+                 max_gaps=1000):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self.heartbeat = heartbeat
+        self.replay_batch = replay_batch
+        self.gap_timeout = gap_timeout
+        self.max_gaps = max_gaps
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        # Reader state: highest change id read and ids below it not seen yet (id -> deadline)
+        self.cursor = None
+        self.gaps = {}
+        self.wakeup = threading.Event()
+        self.reader = None
+
+    def subscribe(self, last_id=None):
+        """Register a stream that wants changes after ``last_id`` (default: from now on)."""
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            if self.cursor is None:
+                self.cursor = self.latest_id()
+            start = self.cursor if last_id is None else last_id
+            subscriber = Subscriber(self.max_queue, start, self.cursor, set(self.gaps))
+            self.subscribers.add(subscriber)
+            if self.reader is None or not self.reader.is_alive():
+                self.reader = threading.Thread(target=self._run_reader, args=(current_app._get_current_object(),),
+                                               daemon=True)
+                self.reader.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            if not self.subscribers:
+                # Nobody is listening: the next subscriber starts from the latest change
+                self.cursor = None
+                self.gaps = {}
+
+    def wake(self):
+        self.wakeup.set()
+
+    def _run_reader(self, app):
+        with app.app_context():
+            while True:
+                self.wakeup.wait(self.gap_timeout if self.gaps else self.heartbeat)
+                self.wakeup.clear()
+                try:
+                    self.read()
+                except Exception:
+                    app.logger.exception('Inventory stream reader failed')
+                finally:
+                    db.session.remove()
+
+    def read(self):
+        """Read the changes after the cursor (and any gaps that have appeared) once and queue them."""
+        while True:
+            with self.lock:
+                if self.cursor is None:
+                    return
+                changes = self.changes_since(self.cursor, self.gaps)
+                now = time.monotonic()
+                for payload in changes:
+                    change_id = payload['id']
+                    late = change_id in self.gaps
+                    if late:
+                        del self.gaps[change_id]
+                    elif change_id > self.cursor:
+                        for missing in range(max(self.cursor + 1, change_id - self.max_gaps), change_id):
+                            self.gaps[missing] = now + self.gap_timeout
+                        self.cursor = change_id
+                    else:
+                        continue
+                    for subscriber in self.subscribers:
+                        if change_id > subscriber.start:
+                            self._offer(subscriber, payload, late)
+                self.gaps = {change_id: deadline for change_id, deadline in self.gaps.items() if deadline > now}
+            if len(changes) < self.replay_batch:
+                return
+
+    def _offer(self, subscriber, payload, late):
+        if not subscriber.overflowed:
+            try:
+                subscriber.queue.put_nowait(payload)
+                return
+            except queue.Full:
+                subscriber.overflowed = True
+        # Changes past the cursor are replayed by range; late ones have to be remembered
+        if late:
+            subscriber.dropped.add(payload['id'])
+
+    def changes_since(self, last_id, gaps=(), until=None):
+        """Changes after ``last_id`` (up to ``until``), plus any of the ``gaps`` ids that have appeared."""
+        condition = InventoryChange.id > last_id
+        if until is not None:
+            condition = condition & (InventoryChange.id <= until)
+        if gaps:
+            condition = condition | InventoryChange.id.in_(list(gaps))
+        rows = db.session.execute(
+            select(InventoryChange).where(condition).order_by(InventoryChange.id).limit(self.replay_batch)
+        ).scalars().all()
+        payloads = [change_to_dict(c) for c in rows]
+        # Don't hold a pooled connection for the lifetime of the stream
+        db.session.close()
+        return payloads
+
+    def latest_id(self):
+        latest = db.session.execute(select(func.max(InventoryChange.id))).scalar() or 0
+        db.session.close()
+        return latest
+
+    def oldest_id(self):
+        oldest = db.session.execute(select(func.min(InventoryChange.id))).scalar()
+        db.session.close()
+        return oldest
+
+    def _replay(self, subscriber, position, missed):
+        """Read ``(position, replay_until]`` and the ``missed`` ids from the table."""
+        while position < subscriber.replay_until or missed:
+            backlog = self.changes_since(position, missed, subscriber.replay_until)
+            for payload in backlog:
+                change_id = payload['id']
+                missed.discard(change_id)
+                position = max(position, change_id)
+                yield payload
+            if len(backlog) < self.replay_batch:
+                break
+        # Whatever is still missing was pruned from the log
+        missed.clear()
+
+    def stream(self, subscriber):
+        """Yield SSE text for one subscriber.
+
+        Changes come from the subscriber's queue. The table is only read here
+        to catch up: after a Last-Event-ID older than the reader's position,
+        and after the queue overflowed.
+        """
+        position = subscriber.start
+        missed = set()
+        # Ids from the replay that the reader may queue again
+        replayed = set()
+        try:
+            yield 'retry: 3000\n\n'
+            if position < subscriber.replay_until:
+                oldest = self.oldest_id()
+                if oldest is not None and position < oldest - 1:
+                    # The log was pruned past the client's position: it has to reload the catalog
+                    yield f"event: reset\ndata: {json.dumps({'oldest_id': oldest})}\n\n"
+            while True:
+                for payload in self._replay(subscriber, position, missed):
+                    position = max(position, payload['id'])
+                    if payload['id'] in subscriber.replay_gaps:
+                        replayed.add(payload['id'])
+                    yield format_event(payload)
+                position = max(position, subscriber.replay_until)
+
+                try:
+                    payload = subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if payload['id'] in replayed:
+                    replayed.discard(payload['id'])
+                else:
+                    position = max(position, payload['id'])
+                    yield format_event(payload)
+
+                if subscriber.overflowed and subscriber.queue.empty():
+                    # Everything queued has been sent: catch up from the table, then go live again
+                    with self.lock:
+                        subscriber.replay_until = self.cursor if self.cursor is not None else position
+                        subscriber.replay_gaps = set(self.gaps)
+                        missed, subscriber.dropped = subscriber.dropped, set()
+                        subscriber.overflowed = False
+        finally:
+            self.unsubscribe(subscriber)
+
+    def prune(self, before):
+        """Delete changes logged before ``before``; clients further behind get a reset event."""
+        deleted = db.session.execute(delete(InventoryChange).where(InventoryChange.datetime < before)).rowcount
+        db.session.commit()
+        return deleted
+
+
+broker = InventoryBroker()
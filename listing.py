@@ -0,0 +1,120 @@
+from math import ceil
+from sqlalchemy import func, select
+from models import db
+
+class ListingPage:
+    """One page of an admin listing plus what the template needs to draw the controls."""
+
+    def __init__(self, listing, items, page, per_page, sort, direction, filters, total, total_capped, has_next,
+                 kept=None):
+        self.listing = listing
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.sort = sort
+        self.direction = direction
+        self.filters = filters
+        self.total = total
+        # True when there are more matching rows than the listing was willing to count
+        self.total_capped = total_capped
+        self.has_prev = page > 1
+        self.has_next = has_next
+        self.kept = kept or {}
+
+    @property
+    def pages(self):
+        if self.total_capped:
+            return None
+        return max(1, ceil(self.total / self.per_page))
+
+    def args(self, **overrides):
+        """Query-string arguments for a link that keeps the current sort and filters."""
+        args = {'page': self.page, 'per_page': self.per_page, 'sort': self.sort, 'dir': self.direction}
+        args.update(self.kept)
+        args.update(self.filters)
+        args.update(overrides)
+        return {k: v for k, v in args.items() if v not in (None, '')}
+
+    def sort_args(self, column):
+        """Arguments for a column header link: toggles direction when already sorted by it."""
+        direction = 'desc' if self.sort == column and self.direction == 'asc' else 'asc'
+        return self.args(sort=column, dir=direction, page=1)
+
+
+class AdminListing:
+    """Server-side page/sort/filter for the admin consoles.
+
+    Every page is a single ``ORDER BY ... LIMIT`` query, so with an index on the
+    sort column SQLite walks only the rows it returns. Sorting is restricted to a
+    whitelist of columns and always ends with the primary key so pages are stable.
+    The total is counted through ``LIMIT count_cap`` so a big table never forces a
+    full count; past the cap the page just reports "N+" results.
+    """
+
+    def __init__(self, model, sorts, filters=None, default_sort='id', default_direction='asc',
+                 per_page=25, max_per_page=100, count_cap=10000, keep_args=()):
+        self.model = model
+        # sort name -> column
+        self.sorts = sorts
+        # query arg -> function(value) returning a filter criterion, or None to ignore the value
+        self.filters = filters or {}
+        self.default_sort = default_sort
+        self.default_direction = default_direction
+        self.per_page = per_page
+        self.max_per_page = max_per_page
+        self.count_cap = count_cap
+        # query args that are not filters but must survive page/sort links
+        self.keep_args = keep_args
+
+    def _int_arg(self, args, name, default, lowest, highest):
+        try:
+            value = int(args.get(name, default))
+        except (TypeError, ValueError):
+            return default
+        return min(max(value, lowest), highest)
+
+    def paginate(self, args, options=()):
+        page = self._int_arg(args, 'page', 1, 1, 10 ** 9)
+        per_page = self._int_arg(args, 'per_page', self.per_page, 1, self.max_per_page)
+
+        sort = args.get('sort', self.default_sort)
+        if sort not in self.sorts:
+            sort = self.default_sort
+        direction = args.get('dir', self.default_direction)
+        if direction not in ('asc', 'desc'):
+            direction = self.default_direction
+
+        criteria = []
+        active_filters = {}
+        for name, build in self.filters.items():
+            value = (args.get(name) or '').strip()
+            if not value:
+                continue
+            criterion = build(value)
+            if criterion is not None:
+                criteria.append(criterion)
+                active_filters[name] = value
+
+        pk = self.model.id
+        column = self.sorts[sort]
+        if direction == 'desc':
+            order_by = [column.desc(), pk.desc()] if column is not pk else [pk.desc()]
+        else:
+            order_by = [column.asc(), pk.asc()] if column is not pk else [pk.asc()]
+
+        # Fetch one extra row to learn whether there is a next page without counting
+        stmt = (select(self.model).where(*criteria).order_by(*order_by)
+                .limit(per_page + 1).offset((page - 1) * per_page).options(*options))
+        rows = db.session.execute(stmt).scalars().all()
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+
+        capped = select(pk).where(*criteria).limit(self.count_cap + 1).subquery()
+        total = db.session.execute(select(func.count()).select_from(capped)).scalar()
+        total_capped = total > self.count_cap
+        if total_capped:
+            total = self.count_cap
+
+        kept = {name: args.get(name) for name in self.keep_args if args.get(name)}
+        return ListingPage(self, items, page, per_page, sort, direction, active_filters,
+                           total, total_capped, has_next, kept)
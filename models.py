@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.schema import CreateTable
 from werkzeug.security import generate_password_hash
 
 # Initialize the extension without the app
@@ -8,7 +9,7 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(32), unique=True)
     passhash = db.Column(db.String(256), nullable=False)
-    name = db.Column(db.String(64), nullable=True)
+    name = db.Column(db.String(64), nullable=True, index=True)
     email = db.Column(db.String(120), unique=True, nullable=True)
     is_admin = db.Column(db.Boolean, nullable=False, default=False)
     transactions = db.relationship('Transaction', backref='user', lazy=True)
@@ -46,12 +47,12 @@ class Category(db.Model):
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(64), nullable=False)
-    price = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(64), nullable=False, index=True)
+    price = db.Column(db.Integer, nullable=False, index=True)
     description = db.Column(db.String(256), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False, index=True)
     # category relationship is defined via backref in Category model
-    quantity = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, index=True)
     man_date = db.Column(db.Date, nullable=False)
     cart_items = db.relationship('Cart', backref='product', lazy=True)
     orders = db.relationship('Order', backref='product', lazy=True)
@@ -59,20 +60,125 @@ class Product(db.Model):
 class Cart(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     user = db.relationship('User', backref='cart_items', lazy=True)
     # product relationship is already defined in Product model with backref='product'
+    __table_args__ = (
+        # A user's cart, and the (user, product) lookup in add_to_cart
+        db.Index('ix_cart_user_product', 'user_id', 'product_id'),
+    )
 
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    datetime = db.Column(db.DateTime, nullable=False)
+    datetime = db.Column(db.DateTime, nullable=False, index=True)
     orders = db.relationship('Order', backref='transaction', lazy=True, cascade='all, delete-orphan')
+    __table_args__ = (
+        db.Index('ix_transaction_user_datetime', 'user_id', 'datetime'),
+        # Archived rows keep their ids, so an id must never be handed out twice,
+        # even after archiving has emptied the table
+        {'sqlite_autoincrement': True},
+    )
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    __table_args__ = {'sqlite_autoincrement': True}
+
+class ProductPair(db.Model):
+    # Sparse product x product co-occurrence matrix: how many transactions
+    # contained both products. Each unordered pair is stored in both directions.
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    other_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (
+        db.Index('ix_product_pair_top', 'product_id', 'count'),
+    )
+
+class InventoryChange(db.Model):
+    # Append-only log of product stock/price changes; its id is the SSE event id
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    event = db.Column(db.String(16), nullable=False)  # created, updated or deleted
+    name = db.Column(db.String(64), nullable=False)
+    price = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    datetime = db.Column(db.DateTime, nullable=False, index=True)
+    # Pruned from the oldest end, so ids (SSE positions) must never be reused
+    __table_args__ = {'sqlite_autoincrement': True}
+
+# Archive: transactions older than ARCHIVE_AFTER_DAYS are moved here with their
+# orders (see archive.py), keeping the hot tables small. Ids are preserved.
+class ArchivedTransaction(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    datetime = db.Column(db.DateTime, nullable=False, index=True)
+    orders = db.relationship('ArchivedOrder', backref='transaction', lazy=True, cascade='all, delete-orphan')
+    user = db.relationship('User', lazy=True, viewonly=True)
+    __table_args__ = (
+        db.Index('ix_archived_transaction_user_datetime', 'user_id', 'datetime'),
+    )
+
+class ArchivedOrder(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('archived_transaction.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
\ No newline at end of file
+    price = db.Column(db.Float, nullable=False)
+    product = db.relationship('Product', lazy=True, viewonly=True)
+
+class UserPurchaseSummary(db.Model):
+    # Running totals over a user's archived transactions
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    transactions = db.Column(db.Integer, nullable=False, default=0)
+    items = db.Column(db.Integer, nullable=False, default=0)
+    total_spent = db.Column(db.Float, nullable=False, default=0)
+    last_purchase = db.Column(db.DateTime, nullable=True)
+
+class ProductSalesSummary(db.Model):
+    # Running totals over a product's archived orders
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+
+def ensure_indexes():
+    # db.create_all() only builds indexes together with a new table, so indexes
+    # added to models later have to be created on existing databases here
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+# Tables that must never reuse an id, with the archive table (if any) holding ids they issued
+AUTOINCREMENT_TABLES = {'transaction': 'archived_transaction', 'order': 'archived_order', 'inventory_change': None}
+
+def ensure_autoincrement():
+    # SQLite cannot add AUTOINCREMENT to an existing table, so tables created
+    # without it are rebuilt: create a copy, move the rows, swap the names.
+    # The id sequence is then started past every id already archived.
+    if db.engine.dialect.name != 'sqlite':
+        return
+    quote = db.engine.dialect.identifier_preparer.quote
+    with db.engine.begin() as conn:
+        for name, archive in AUTOINCREMENT_TABLES.items():
+            table = db.metadata.tables[name]
+            sql = conn.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).scalar()
+            if sql is None or 'AUTOINCREMENT' in sql.upper():
+                continue
+            columns = ', '.join(quote(c.name) for c in table.columns)
+            create = str(CreateTable(table).compile(conn))
+            conn.exec_driver_sql(create.replace(f'TABLE {quote(name)}', f'TABLE {quote(name + "_new")}', 1))
+            conn.exec_driver_sql(f'INSERT INTO {quote(name + "_new")} ({columns}) SELECT {columns} FROM {quote(name)}')
+            conn.exec_driver_sql(f'DROP TABLE {quote(name)}')
+            conn.exec_driver_sql(f'ALTER TABLE {quote(name + "_new")} RENAME TO {quote(name)}')
+            ids = f'SELECT id FROM {quote(name)}'
+            if archive:
+                ids += f' UNION ALL SELECT id FROM {quote(archive)}'
+            highest = conn.exec_driver_sql(f'SELECT MAX(id) FROM ({ids})').scalar()
+            conn.exec_driver_sql('DELETE FROM sqlite_sequence WHERE name = ?', (name,))
+            conn.exec_driver_sql('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (name, highest or 0))
@@ -0,0 +1,92 @@
+import re
+from contextlib import contextmanager
+from sqlalchemy import event
+from models import db, User, Category, Product, Transaction
+
+# Requests on the hot paths, in order: (label, method, path, form data, as admin).
+# {product_id}, {user_id} and {category_id} are filled in from the database.
+HOT_PATHS = [
+    ('storefront', 'GET', '/?category={category_id}&min_price=10&max_price=500&in_stock=1', None, False),
+    ('search', 'GET', '/search?q=product&page=2', None, False),
+    ('add to cart', 'POST', '/add_to_cart/{product_id}', {'quantity': '1'}, False),
+    ('cart', 'GET', '/cart', None, False),
+    ('buy', 'POST', '/buy', None, False),
+    ('profile', 'GET', '/profile', None, False),
+    ('history export', 'GET', '/export_transactions_csv', None, False),
+    ('product api', 'GET', '/api/products/{product_id}', None, False),
+    ('recommendations', 'GET', '/api/products/{product_id}/recommendations', None, False),
+    ('typeahead', 'GET', '/api/products/suggest?q=pro', None, False),
+    ('admin dashboard', 'GET', '/admin', None, True),
+    ('product delete guard', 'POST', '/admin/products/delete/{product_id}', None, True),
+    ('user delete guard', 'POST', '/admin/users/delete/{user_id}', None, True),
+    ('category delete guard', 'POST', '/admin/categories/delete/{category_id}', None, True),
+]
+
+@contextmanager
+def record_queries(engine):
+    """Collect (statement, parameters) for every SELECT/UPDATE/DELETE sent to the database."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+def query_plan(statement, parameters):
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    return [row[-1] for row in rows]
+
+def full_scans(statement, plan):
+    """Tables the plan reads row by row without an index.
+
+    A statement without a WHERE clause (listing a whole table, rebuilding a
+    cache) is a deliberate full read and is not reported.
+    """
+    if ' WHERE ' not in ' '.join(statement.upper().split()):
+        return []
+    tables = set(db.metadata.tables)
+    scans = []
+    for detail in plan:
+        match = re.fullmatch(r'SCAN (?:TABLE )?(\w+)', detail)
+        if match:
+            # joined/aliased tables show up as e.g. product_1
+            table = match.group(1) if match.group(1) in tables else re.sub(r'_\d+$', '', match.group(1))
+            if table in tables:
+                scans.append(table)
+    return scans
+
+def audit_hot_paths(app, paths=HOT_PATHS):
+    """Replay the hot paths and return (label, statement, plan, full scans) for each distinct query."""
+    product = Product.query.filter(Product.quantity > 0).order_by(Product.id).first()
+    transaction = Transaction.query.order_by(Transaction.id).first()
+    ids = {
+        'product_id': product.id,
+        'user_id': transaction.user_id,
+        'category_id': Category.query.order_by(Category.id).first().id,
+    }
+    admin_id = User.query.filter_by(is_admin=True).first().id
+    db.session.remove()
+
+    client = app.test_client()
+    results = []
+    for label, method, path, data, as_admin in paths:
+        with client.session_transaction() as sess:
+            sess['user_id'] = admin_id if as_admin else ids['user_id']
+        with record_queries(db.engine) as statements:
+            response = client.open(path.format(**ids), method=method, data=data)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{label}: {method} {path} returned {response.status_code}')
+        seen = set()
+        for statement, parameters in statements:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            plan = query_plan(statement, parameters)
+            results.append((label, statement, plan, full_scans(statement, plan)))
+        db.session.remove()
+    return results
@@ -0,0 +1,217 @@
+import itertools
+import math
+import sqlite3
+import threading
+import time
+from flask import current_app, g, jsonify, request, session
+
+class MemoryBackend:
+    """Token buckets kept in this process. Fine for a single worker."""
+
+    def __init__(self, max_keys=100000):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.max_keys = max_keys
+
+    def consume(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            tokens, updated, _ = self.buckets.get(key, (burst, now, 0))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            # Keep the time this bucket's own rule needs to refill it completely
+            self.buckets[key] = (tokens, now, (burst - tokens) / rate)
+            if len(self.buckets) > self.max_keys:
+                self._prune(now)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def _prune(self, now):
+        # A bucket that has had time to refill completely is the same as no bucket
+        self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < v[2]}
+        if len(self.buckets) > self.max_keys:
+            # Still too many active clients: start over rather than grow without bound
+            self.buckets = {}
+
+
+class SQLiteBackend:
+    """Token buckets in a SQLite file shared by every worker process on the host."""
+
+    def __init__(self, path, prune_every=1000):
+        self.path = path
+        self.prune_every = prune_every
+        self.calls = itertools.count(1)
+        self.local = threading.local()
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS ratelimit_bucket ('
+                     'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+                     'full_at REAL NOT NULL DEFAULT 0)')
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(ratelimit_bucket)')}
+        if 'full_at' not in columns:
+            conn.execute('ALTER TABLE ratelimit_bucket ADD COLUMN full_at REAL NOT NULL DEFAULT 0')
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # Autocommit mode so the explicit BEGIN IMMEDIATE below controls locking
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def consume(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM ratelimit_bucket WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            # full_at: when this bucket's own rule has refilled it, so it can be pruned
+            conn.execute('INSERT INTO ratelimit_bucket (key, tokens, updated, full_at) VALUES (?, ?, ?, ?) '
+                         'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated, '
+                         'full_at = excluded.full_at',
+                         (key, tokens, now, now + (burst - tokens) / rate))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if next(self.calls) % self.prune_every == 0:
+            self.prune(now)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def prune(self, now=None):
+        """Delete buckets that have refilled completely; they are the same as no bucket."""
+        conn = self._connect()
+        return conn.execute('DELETE FROM ratelimit_bucket WHERE full_at <= ?',
+                            (time.time() if now is None else now,)).rowcount
+
+
+def make_backend(storage):
+    if storage == 'memory':
+        return MemoryBackend()
+    if storage.startswith('sqlite:///'):
+        return SQLiteBackend(storage[len('sqlite:///'):])
+    raise ValueError(f'Unknown RATELIMIT_STORAGE: {storage}')
+
+
+class RateLimiter:
+    """Admission control for the hot endpoints.
+
+    Two checks run before every request:
+
+    * a per-process cap on requests in flight (``MAX_CONCURRENT_REQUESTS``);
+      excess requests get a 503 straight away instead of queueing on the
+      SQLite write lock.
+    * token buckets from ``RATELIMIT_RULES``, looked up by endpoint first and
+      then by blueprint. Each rule is ``(tokens per second, burst)`` and is
+      applied separately to the session user and to the client IP. An empty
+      bucket answers 429 with a ``Retry-After`` header.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.rules = {}
+        self.semaphore = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE', 'memory')
+        app.config.setdefault('RATELIMIT_RULES', {})
+        app.config.setdefault('RATELIMIT_TRUSTED_PROXIES', 0)
+        app.config.setdefault('MAX_CONCURRENT_REQUESTS', 0)
+        app.config.setdefault('CONCURRENCY_QUEUE_TIMEOUT', 0)
+        app.config.setdefault('CONCURRENCY_EXEMPT_ENDPOINTS', set())
+
+        self.rules = app.config['RATELIMIT_RULES']
+        self.trusted_proxies = app.config['RATELIMIT_TRUSTED_PROXIES']
+        self.backend = make_backend(app.config['RATELIMIT_STORAGE'])
+        if app.config['MAX_CONCURRENT_REQUESTS']:
+            self.semaphore = threading.BoundedSemaphore(app.config['MAX_CONCURRENT_REQUESTS'])
+        self.queue_timeout = app.config['CONCURRENCY_QUEUE_TIMEOUT']
+        self.concurrency_exempt = app.config['CONCURRENCY_EXEMPT_ENDPOINTS']
+
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+        app.extensions['ratelimit'] = self
+
+    def rule_for(self, endpoint, blueprint):
+        """Return ``(scope, rule)``; buckets are shared by everything in the scope."""
+        if endpoint in self.rules:
+            return endpoint, self.rules[endpoint]
+        if blueprint in self.rules:
+            return blueprint, self.rules[blueprint]
+        return None, None
+
+    def check(self, rule, keys):
+        """Consume a token for every key; returns the longest wait if any bucket is empty."""
+        rate, burst = rule
+        retry_after = 0
+        for key in keys:
+            allowed, wait = self.backend.consume(key, rate, burst)
+            if not allowed:
+                retry_after = max(retry_after, wait)
+        return retry_after
+
+    def client_ip(self):
+        """The client address, read from X-Forwarded-For when behind trusted proxies.
+
+        With ``RATELIMIT_TRUSTED_PROXIES = n`` the n-th address from the right
+        is used: the one the outermost trusted proxy saw. Anything further
+        left was written by the client and cannot be trusted.
+        """
+        if self.trusted_proxies:
+            forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+            if len(forwarded) >= self.trusted_proxies:
+                return forwarded[-self.trusted_proxies]
+        return request.remote_addr
+
+    def _admit(self):
+        if request.endpoint in (None, 'static'):
+            return None
+        # Batched sub-requests run under the slot their parent request already holds
+        if (self.semaphore is not None and request.endpoint not in self.concurrency_exempt
+                and 'ratelimit_slot' not in g):
+            if self.queue_timeout:
+                acquired = self.semaphore.acquire(timeout=self.queue_timeout)
+            else:
+                acquired = self.semaphore.acquire(blocking=False)
+            if not acquired:
+                return self._reject(503, 'Server busy, try again shortly', 1)
+            g.ratelimit_slot = request._get_current_object()
+
+        if not current_app.config['RATELIMIT_ENABLED']:
+            return None
+        if 'ratelimit_batch' in g:
+            return None  # a batched sub-request; the batch itself was already charged
+        scope, rule = self.rule_for(request.endpoint, request.blueprint)
+        if rule is None:
+            return None
+        keys = [f'{scope}:ip:{self.client_ip()}']
+        if 'user_id' in session:
+            keys.append(f"{scope}:user:{session['user_id']}")
+        retry_after = self.check(rule, keys)
+        if retry_after:
+            return self._reject(429, 'Too many requests', retry_after)
+        return None
+
+    def _release(self, exc=None):
+        if g.get('ratelimit_slot') is request._get_current_object():
+            g.pop('ratelimit_slot')
+            self.semaphore.release()
+
+    def _reject(self, status, message, retry_after):
+        headers = {'Retry-After': str(max(1, math.ceil(retry_after)))}
+        if request.blueprint == 'api':
+            return jsonify({'error': message}), status, headers
+        return message, status, headers
+
+
+limiter = RateLimiter()
@@ -0,0 +1,111 @@
+import heapq
+import threading
+import time
+from itertools import permutations
+from flask import current_app
+from sqlalchemy import delete, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, ProductPair
+
+class Recommender:
+    """Frequently-bought-together recommendations from the ProductPair table.
+
+    ``record_purchase`` bumps the pair counts for one basket right after
+    ``buy()`` commits, and ``rebuild`` recomputes the whole matrix from the
+    hot and archived orders in one INSERT ... SELECT. Lookups read each product's top-K
+    neighbours through the (product_id, count) index once and keep them in a
+    per-process cache, so serving a product is a slice of a precomputed list
+    and serving a cart merges K neighbours per cart line. Cache entries expire
+    after ``ttl`` seconds so other worker processes pick up new purchases.
+    """
+
+    def __init__(self, top_k=10, ttl=300, max_cached=50000):
+        self.top_k = top_k
+        self.ttl = ttl
+        self.max_cached = max_cached
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def invalidate(self, product_ids=None):
+        with self.lock:
+            if product_ids is None:
+                self.cache.clear()
+            else:
+                for product_id in product_ids:
+                    self.cache.pop(product_id, None)
+
+    def neighbors(self, product_id):
+        """Top-K ``(other_id, count)`` pairs for one product, strongest first."""
+        now = time.monotonic()
+        entry = self.cache.get(product_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        rows = db.session.execute(
+            select(ProductPair.other_id, ProductPair.count)
+            .where(ProductPair.product_id == product_id)
+            .order_by(ProductPair.count.desc(), ProductPair.other_id)
+            .limit(self.top_k)
+        ).all()
+        top = [(other_id, count) for other_id, count in rows]
+        with self.lock:
+            if len(self.cache) >= self.max_cached:
+                self.cache.clear()
+            self.cache[product_id] = (now + self.ttl, top)
+        return top
+
+    def for_product(self, product_id, limit=None):
+        return self.neighbors(product_id)[:limit or self.top_k]
+
+    def for_cart(self, product_ids, limit=None):
+        """Neighbours of every product in the cart, summed, minus what is already in it."""
+        in_cart = set(product_ids)
+        scores = {}
+        for product_id in in_cart:
+            for other_id, count in self.neighbors(product_id):
+                if other_id not in in_cart:
+                    scores[other_id] = scores.get(other_id, 0) + count
+        return heapq.nlargest(limit or self.top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def record_purchase(self, product_ids):
+        """Count one more co-occurrence for every pair of distinct products bought together.
+
+        Called after the purchase has committed, so a failure here is logged
+        and rolled back rather than raised: the pair counts catch up at the
+        next ``rebuild``.
+        """
+        basket = sorted(set(product_ids))
+        if len(basket) < 2:
+            return
+        try:
+            # One upsert per pair, so concurrent purchases of the same pair cannot collide
+            db.session.execute(text(
+                'INSERT INTO product_pair (product_id, other_id, count) VALUES (:product_id, :other_id, 1) '
+                'ON CONFLICT (product_id, other_id) DO UPDATE SET count = product_pair.count + 1'
+            ), [{'product_id': product_id, 'other_id': other_id} for product_id, other_id in permutations(basket, 2)])
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            current_app.logger.exception('Could not record purchase pairs for products %s', basket)
+            return
+        self.invalidate(basket)
+
+    def rebuild(self):
+        """Recompute the whole co-occurrence matrix from Order history, archive included."""
+        db.session.execute(delete(ProductPair))
+        db.session.execute(text(
+            'WITH all_orders AS ('
+            'SELECT transaction_id, product_id FROM "order" '
+            'UNION ALL SELECT transaction_id, product_id FROM archived_order) '
+            'INSERT INTO product_pair (product_id, other_id, count) '
+            'SELECT a.product_id, b.product_id, COUNT(DISTINCT a.transaction_id) '
+            'FROM all_orders a JOIN all_orders b '
+            'ON a.transaction_id = b.transaction_id AND a.product_id != b.product_id '
+            'GROUP BY a.product_id, b.product_id'
+        ))
+        db.session.commit()
+        self.invalidate()
+        return db.session.query(ProductPair).count()
+
+
+recommender = Recommender()
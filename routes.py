@@ -1,6 +1,13 @@
 from flask import Blueprint, render_template, url_for, request, redirect, flash, session, Response
-from models import db, User, Category, Product, Transaction, Cart, Order
+from models import db, User, Category, Product, Transaction, Cart, Order, ArchivedTransaction, ArchivedOrder, UserPurchaseSummary
+from listing import AdminListing
+from recommendations import recommender
+from suggest import suggester
+from catalog import catalog
+from inventory_stream import record_change
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import exists, func, select
+from sqlalchemy.orm import joinedload
 from functools import wraps
 from datetime import datetime
 import csv
@@ -9,6 +16,56 @@ import io
 # Create a Blueprint object
 main = Blueprint('main', __name__)
 
+def id_filter(column):
+    """Filter ``column`` by an id query parameter, ignoring values that are not a valid id."""
+    def criterion(value):
+        try:
+            value = int(value)
+        except ValueError:
+            return None
+        # SQLite cannot bind integers outside 64 bits
+        return column == value if 1 <= value <= 2 ** 63 - 1 else None
+    return criterion
+
+# Admin console listings (page/sort/filter via query parameters)
+product_listing = AdminListing(
+    Product,
+    sorts={'id': Product.id, 'name': Product.name, 'price': Product.price, 'quantity': Product.quantity},
+    filters={
+        'q': lambda v: Product.name.contains(v),
+        'category': id_filter(Product.category_id),
+        'stock': lambda v: {'in': Product.quantity > 0, 'out': Product.quantity <= 0}.get(v),
+    },
+)
+
+user_listing = AdminListing(
+    User,
+    sorts={'id': User.id, 'username': User.username, 'name': User.name, 'email': User.email},
+    filters={
+        'q': lambda v: User.username.contains(v) | User.email.contains(v),
+        'role': lambda v: {'admin': User.is_admin.is_(True), 'user': User.is_admin.is_(False)}.get(v),
+    },
+)
+
+category_listing = AdminListing(
+    Category,
+    sorts={'id': Category.id, 'name': Category.name},
+    filters={'q': lambda v: Category.name.contains(v)},
+)
+
+archived_transaction_listing = AdminListing(
+    ArchivedTransaction,
+    sorts={'datetime': ArchivedTransaction.datetime},
+    filters={'user': id_filter(ArchivedTransaction.user_id)},
+    default_sort='datetime',
+    default_direction='desc',
+    keep_args=('archived',),
+)
+
+def history_model():
+    """Transaction history views read the archive only when asked to with ?archived=1."""
+    return ArchivedTransaction if request.args.get('archived') == '1' else Transaction
+
 # BASIC ROUTES
 @main.route('/')
 def index():
@@ -24,50 +81,17 @@ def index():
         # 4. Otherwise, show them the standard homepage with products and categories
         categories = Category.query.all()
         
-        # Handle search and filter queries
-        query = request.args.get('q', '')
-        category_filter = request.args.get('category', '')
-        min_price = request.args.get('min_price', '')
-        max_price = request.args.get('max_price', '')
-        
-        # Base query
-        products_query = Product.query
-        
-        # Apply search filter
-        if query:
-            products_query = products_query.filter(
-                (Product.name.contains(query)) | (Product.description.contains(query))
-            )
-        
-        # Apply category filter
-        if category_filter:
-            products_query = products_query.filter(Product.category_id == category_filter)
-        
-        # Apply price filters
-        if min_price:
-            try:
-                min_price_val = float(min_price)
-                products_query = products_query.filter(Product.price >= min_price_val)
-            except ValueError:
-                pass
-        
-        if max_price:
-            try:
-                max_price_val = float(max_price)
-                products_query = products_query.filter(Product.price <= max_price_val)
-            except ValueError:
-                pass
-        
-        products = products_query.all()
+        # Search and filters are answered from the in-memory catalog snapshot;
+        # only the products on this page are loaded from the database
+        listing = catalog.page(request.args)
         
         # Group products by category for display
         products_by_category = {}
-        for category in categories:
-            category_products = [p for p in products if p.category_id == category.id]
-            if category_products:  # Only include categories that have products
-                products_by_category[category] = category_products
+        category_by_id = {category.id: category for category in categories}
+        for product in listing.items:
+            products_by_category.setdefault(category_by_id[product.category_id], []).append(product)
         
-        return render_template("index.html", name=user.name, user=user, categories=categories, products_by_category=products_by_category, query=query, category_filter=category_filter, min_price=min_price, max_price=max_price)
+        return render_template("index.html", name=user.name, user=user, categories=categories, products_by_category=products_by_category, listing=listing, category_counts=catalog.category_counts(), query=request.args.get('q', ''), category_filter=request.args.get('category', ''), min_price=request.args.get('min_price', ''), max_price=request.args.get('max_price', ''), in_stock=request.args.get('in_stock', ''))
 
     # 5. If not logged in at all, send to login
     flash('Please log in to access the store.', 'warning')
@@ -150,8 +174,11 @@ def profile():
     user_id = session['user_id']
     user = User.query.get(user_id)
     # Fetch transactions with orders for the user
-    transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.datetime.desc()).all()
-    return render_template('profile.html', user=user, transactions=transactions)
+    model = history_model()
+    transactions = model.query.filter_by(user_id=user_id).order_by(model.datetime.desc()).all()
+    archive_summary = UserPurchaseSummary.query.get(user_id)
+    return render_template('profile.html', user=user, transactions=transactions,
+                           archived=model is ArchivedTransaction, archive_summary=archive_summary)
 
 @main.route("/profile", methods=["POST"])
 @auth_required
@@ -189,7 +216,8 @@ def profile_edit():
 def export_transactions_csv():
     user_id = session['user_id']
     user = User.query.get(user_id)
-    transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.datetime.desc()).all()
+    model = history_model()
+    transactions = model.query.filter_by(user_id=user_id).order_by(model.datetime.desc()).all()
     
     # Create CSV data
     output = io.StringIO()
@@ -216,7 +244,7 @@ def export_transactions_csv():
         output.getvalue(),
         mimetype='text/csv',
         headers={
-            'Content-Disposition': f'attachment; filename={user.username}_transactions.csv'
+            'Content-Disposition': f'attachment; filename={user.username}_{"archived_" if model is ArchivedTransaction else ""}transactions.csv'
         }
     )
     
@@ -237,44 +265,9 @@ def search():
     user_id = session['user_id']
     user = User.query.get(user_id)
     categories = Category.query.all()
+    listing = catalog.page(request.args)
     
-    # Handle search and filter queries
-    query = request.args.get('q', '')
-    category_filter = request.args.get('category', '')
-    min_price = request.args.get('min_price', '')
-    max_price = request.args.get('max_price', '')
-    
-    # Base query
-    products_query = Product.query
-    
-    # Apply search filter
-    if query:
-        products_query = products_query.filter(
-            (Product.name.contains(query)) | (Product.description.contains(query))
-        )
-    
-    # Apply category filter
-    if category_filter:
-        products_query = products_query.filter(Product.category_id == category_filter)
-    
-    # Apply price filters
-    if min_price:
-        try:
-            min_price_val = float(min_price)
-            products_query = products_query.filter(Product.price >= min_price_val)
-        except ValueError:
-            pass
-    
-    if max_price:
-        try:
-            max_price_val = float(max_price)
-            products_query = products_query.filter(Product.price <= max_price_val)
-        except ValueError:
-            pass
-    
-    products = products_query.all()
-    
-    return render_template('searchbar.html', user=user, products=products, categories=categories, query=query, category_filter=category_filter, min_price=min_price, max_price=max_price)
+    return render_template('searchbar.html', user=user, products=listing.items, listing=listing, categories=categories, query=request.args.get('q', ''), category_filter=request.args.get('category', ''), min_price=request.args.get('min_price', ''), max_price=request.args.get('max_price', ''), in_stock=request.args.get('in_stock', ''))
 
 @main.route('/add_to_cart/<int:product_id>', methods=['POST'])
 @auth_required
@@ -306,7 +299,11 @@ def cart():
     user = User.query.get(user_id)
     cart_items = Cart.query.filter_by(user_id=user_id).all()
     total = sum(item.quantity * item.product.price for item in cart_items)
-    return render_template('cart.html', user=user, cart_items=cart_items, total=total)
+    # Frequently bought together with what is in the cart
+    scored = recommender.for_cart([item.product_id for item in cart_items], limit=4)
+    products = {p.id: p for p in Product.query.filter(Product.id.in_([pid for pid, _ in scored])).all()} if scored else {}
+    recommendations = [products[pid] for pid, _ in scored if pid in products and products[pid].quantity > 0]
+    return render_template('cart.html', user=user, cart_items=cart_items, total=total, recommendations=recommendations)
 
 @main.route('/update_cart/<int:cart_id>', methods=['POST'])
 @auth_required
@@ -366,6 +363,8 @@ def buy():
     db.session.commit()
     
     # Create orders and update stock
+    purchased_ids = [item.product_id for item in cart_items]
+    stock = []
     for item in cart_items:
         order = Order(
             transaction_id=transaction.id,
@@ -375,9 +374,13 @@ def buy():
         )
         db.session.add(order)
         item.product.quantity -= item.quantity
+        record_change(item.product)
+        stock.append((item.product_id, item.product.category_id, item.product.price, item.product.quantity))
         db.session.delete(item)
     
     db.session.commit()
+    catalog.stock_changed(stock)
+    recommender.record_purchase(purchased_ids)
     flash('Purchase successful!', 'success')
     return redirect(url_for('main.index'))
 
@@ -411,8 +414,15 @@ def admin():
 @main.route('/admin/categories')
 @admin_required
 def admin_categories():
-    categories = Category.query.all()
-    return render_template('category/admin_categories.html', categories=categories)
+    listing = category_listing.paginate(request.args)
+    # Count products only for the categories on this page
+    ids = [c.id for c in listing.items]
+    product_counts = dict(db.session.execute(
+        select(Product.category_id, func.count(Product.id))
+        .where(Product.category_id.in_(ids))
+        .group_by(Product.category_id)
+    ).all()) if ids else {}
+    return render_template('category/admin_categories.html', categories=listing.items, listing=listing, product_counts=product_counts)
 
 @main.route('/admin/categories/add', methods=['GET', 'POST'])
 @admin_required
@@ -432,6 +442,7 @@ def admin_add_category():
         new_category = Category(name=name)
         db.session.add(new_category)
         db.session.commit()
+        suggester.category_changed(new_category)
         flash('Category added successfully.', 'success')
         return redirect(url_for('main.admin_categories'))
     
@@ -456,6 +467,7 @@ def admin_edit_category(category_id):
         
         category.name = name
         db.session.commit()
+        suggester.category_changed(category)
         flash('Category updated successfully.', 'success')
         return redirect(url_for('main.admin_categories'))
     
@@ -467,12 +479,13 @@ def admin_delete_category(category_id):
     category = Category.query.get_or_404(category_id)
     
     # Check if category has products
-    if category.products:
+    if db.session.query(exists().where(Product.category_id == category_id)).scalar():
         flash('Cannot delete category with existing products.', 'danger')
         return redirect(url_for('main.admin_categories'))
     
     db.session.delete(category)
     db.session.commit()
+    suggester.category_deleted(category_id)
     flash('Category deleted successfully.', 'success')
     return redirect(url_for('main.admin_categories'))
 
@@ -481,8 +494,9 @@ def admin_delete_category(category_id):
 @main.route('/admin/products')
 @admin_required
 def admin_products():
-    products = Product.query.all()
-    return render_template('product/admin_products.html', products=products)
+    listing = product_listing.paginate(request.args, options=[joinedload(Product.category)])
+    categories = Category.query.order_by(Category.name).all()
+    return render_template('product/admin_products.html', products=listing.items, listing=listing, categories=categories)
 
 @main.route('/admin/products/add', methods=['GET', 'POST'])
 @admin_required
@@ -526,7 +540,11 @@ def admin_add_product():
             man_date=man_date_obj
         )
         db.session.add(new_product)
+        db.session.flush()
+        record_change(new_product, 'created')
         db.session.commit()
+        suggester.product_changed(new_product)
+        catalog.invalidate()
         flash('Product added successfully.', 'success')
         return redirect(url_for('main.admin_products'))
     
@@ -575,7 +593,10 @@ def admin_edit_product(product_id):
         product.category_id = category_id
         product.quantity = quantity
         product.man_date = man_date_obj
+        record_change(product)
         db.session.commit()
+        suggester.product_changed(product)
+        catalog.invalidate()
         flash('Product updated successfully.', 'success')
         return redirect(url_for('main.admin_products'))
     
@@ -588,12 +609,19 @@ def admin_delete_product(product_id):
     product = Product.query.get_or_404(product_id)
     
     # Check if product is in cart or has orders
-    if product.cart_items or product.orders:
+    in_use = db.session.query(
+        exists().where(Cart.product_id == product_id) | exists().where(Order.product_id == product_id)
+        | exists().where(ArchivedOrder.product_id == product_id)
+    ).scalar()
+    if in_use:
         flash('Cannot delete product that is in carts or has been ordered.', 'danger')
         return redirect(url_for('main.admin_products'))
     
+    record_change(product, 'deleted')
     db.session.delete(product)
     db.session.commit()
+    suggester.product_deleted(product_id)
+    catalog.invalidate()
     flash('Product deleted successfully.', 'success')
     return redirect(url_for('main.admin_products'))
 
@@ -602,8 +630,8 @@ def admin_delete_product(product_id):
 @main.route('/admin/users')
 @admin_required
 def admin_users():
-    users = User.query.all()
-    return render_template('user/admin_users.html', users=users)
+    listing = user_listing.paginate(request.args)
+    return render_template('user/admin_users.html', users=listing.items, listing=listing)
 
 @main.route('/admin/users/delete/<int:user_id>', methods=['POST'])
 @admin_required
@@ -615,7 +643,10 @@ def admin_delete_user(user_id):
         return redirect(url_for('main.admin_users'))
     
     # Check if user has transactions
-    if user.transactions:
+    has_history = db.session.query(
+        exists().where(Transaction.user_id == user_id) | exists().where(ArchivedTransaction.user_id == user_id)
+    ).scalar()
+    if has_history:
         flash('Cannot delete user with transaction history.', 'danger')
         return redirect(url_for('main.admin_users'))
     
@@ -631,5 +662,9 @@ def admin_delete_user(user_id):
 def admin_transactions():
     user_id = session['user_id']
     user = User.query.get(user_id)
+    if history_model() is ArchivedTransaction:
+        listing = archived_transaction_listing.paginate(request.args)
+        return render_template('admin_transactions.html', user=user, transactions=listing.items,
+                               listing=listing, archived=True)
     transactions = Transaction.query.order_by(Transaction.datetime.desc()).all()
-    return render_template('admin_transactions.html', user=user, transactions=transactions)
\ No newline at end of file
+    return render_template('admin_transactions.html', user=user, transactions=transactions, archived=False)
\ No newline at end of file
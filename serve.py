@@ -0,0 +1,214 @@
+"""Production entry point: a pre-forking server for Kirana Dukaan.
+
+    APP_ENV=production python serve.py --bind 0.0.0.0:8000 --workers 4
+
+The master process builds the app once (imports, schema checks, template,
+catalog snapshot and typeahead warm-up) and then forks the workers, so they
+start already warm and share the preloaded memory copy-on-write. Each worker serves the shared
+listening socket with a threaded WSGI server.
+
+Signals to the master:
+    SIGTERM / SIGINT  graceful shutdown: workers finish in-flight requests
+    SIGHUP            graceful reload: warm up again, start a new set of
+                      workers, then retire the old ones (code changes still
+                      need a restart)
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from sqlalchemy import event
+from werkzeug.serving import make_server
+from app import create_app
+from config import config_from_env
+from models import db, Category
+from suggest import suggester
+from catalog import catalog
+
+def tune_sqlite(engine):
+    """WAL and a busy timeout let several worker processes share one SQLite file."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
+
+def warm_up(app):
+    """Load what the first requests would otherwise pay for."""
+    start = time.perf_counter()
+    app.extensions['ready'] = False
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+    with app.app_context():
+        Category.query.all()
+        catalog.rebuild()
+        suggester.rebuild()
+        db.session.remove()
+    app.extensions['ready'] = True
+    return time.perf_counter() - start
+
+
+class Worker:
+    def __init__(self, app, sock, host, port, graceful_timeout):
+        self.app = app
+        self.sock = sock
+        self.host = host
+        self.port = port
+        self.graceful_timeout = graceful_timeout
+        self.server = None
+
+    def stop(self, signum=None, frame=None):
+        # Fail readiness first so a load balancer stops sending traffic
+        self.app.extensions['ready'] = False
+        if self.server is not None:
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        # Connections inherited from the master must not be shared across processes
+        with self.app.app_context():
+            db.engine.dispose(close=False)
+
+        self.server = make_server(self.host, self.port, self.app, threaded=True, fd=self.sock.fileno())
+        baseline = threading.active_count()
+        self.server.serve_forever()
+
+        # Let in-flight requests finish before the process exits
+        deadline = time.monotonic() + self.graceful_timeout
+        while threading.active_count() > baseline and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+class Master:
+    def __init__(self, app, sock, host, port, workers, graceful_timeout, warm):
+        self.app = app
+        self.sock = sock
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.warm = warm
+        self.children = set()
+        # workers from before a reload, finishing their requests
+        self.retiring = set()
+        self.stopping = False
+        self.reload_requested = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                Worker(self.app, self.sock, self.host, self.port, self.graceful_timeout).run()
+            finally:
+                os._exit(0)
+        self.children.add(pid)
+        return pid
+
+    def spawn_all(self):
+        # Objects created so far are never freed; keeping them out of the GC's
+        # reach stops it from touching (and so copying) their shared pages
+        gc.collect()
+        gc.freeze()
+        return {self.spawn() for _ in range(self.workers)}
+
+    def signal_children(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.discard(pid)
+            if pid in self.children:
+                self.children.discard(pid)
+                if not self.stopping:
+                    print(f'[serve] worker {pid} exited, starting a replacement', flush=True)
+                    self.spawn()
+
+    def reload(self):
+        self.reload_requested = False
+        if self.warm:
+            print(f'[serve] reload: warmed up in {warm_up(self.app):.2f}s', flush=True)
+        old, self.children = self.children, set()
+        self.retiring |= old
+        self.spawn_all()
+        self.signal_children(old, signal.SIGTERM)
+
+    def run(self):
+        def on_stop(signum, frame):
+            self.stopping = True
+
+        def on_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_reload)
+
+        self.spawn_all()
+        print(f'[serve] master {os.getpid()} serving http://{self.host}:{self.port} '
+              f'with {self.workers} workers', flush=True)
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload()
+            self.reap()
+            time.sleep(0.2)
+
+        self.signal_children(self.children, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 1
+        while (self.children or self.retiring) and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        self.signal_children(self.children | self.retiring, signal.SIGKILL)
+        self.sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run Kirana Dukaan with pre-forked workers.')
+    parser.add_argument('--bind', default=os.getenv('BIND', '127.0.0.1:8000'), help='host:port to listen on')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='Seconds a stopping worker waits for in-flight requests')
+    parser.add_argument('--no-warmup', dest='warm', action='store_false', help='Skip the catalog/template warm-up')
+    args = parser.parse_args(argv)
+
+    host, _, port = args.bind.rpartition(':')
+    port = int(port)
+    app = create_app(config_from_env('production'))
+    with app.app_context():
+        tune_sqlite(db.engine)
+        db.engine.dispose()
+    if args.workers > 1 and app.config['RATELIMIT_STORAGE'] == 'memory':
+        print('[serve] warning: RATELIMIT_STORAGE=memory keeps separate limits per worker; '
+              'use sqlite:///... to share them', file=sys.stderr, flush=True)
+    if args.warm:
+        print(f'[serve] warmed up in {warm_up(app):.2f}s', flush=True)
+
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    Master(app, sock, host, port, args.workers, args.graceful_timeout, args.warm).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+import heapq
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from flask import current_app
+from sqlalchemy import func, select
+from models import db, Category, Product, Order, ProductSalesSummary
+
+PRODUCT, CATEGORY = 0, 1
+KINDS = {PRODUCT: 'product', CATEGORY: 'category'}
+
+def _word_starts(name):
+    """Keys a name can be found under: the whole name and every later word onwards."""
+    words = name.lower().split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class SuggestIndex:
+    """Immutable prefix index over product and category names.
+
+    Every name is stored under each of its word starts in one sorted list of
+    keys, so the names matching a prefix are a contiguous slice found with two
+    bisects. Short, popular prefixes ("a", "mil") can match a large slice, so
+    the top results of every prefix matching more than ``scan_limit`` keys are
+    precomputed at build time; any other prefix scans at most ``scan_limit``
+    keys. Either way a lookup does bounded work, independent of catalog size.
+    """
+
+    def __init__(self, records, top_n=20, scan_limit=256):
+        # records: iterable of (kind, id, name, weight)
+        self.top_n = top_n
+        self.scan_limit = scan_limit
+        self.kinds = bytearray()
+        self.ids = array('q')
+        self.weights = array('d')
+        self.names = []
+        pairs = []
+        for kind, record_id, name, weight in records:
+            rec = len(self.names)
+            self.kinds.append(kind)
+            self.ids.append(record_id)
+            self.weights.append(weight)
+            self.names.append(name)
+            pairs.extend((key, rec) for key in _word_starts(name))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.key_recs = array('q', (rec for _, rec in pairs))
+        del pairs
+        self.heavy = {}
+        if len(self.keys) > scan_limit:
+            self._precompute('', 0, len(self.keys))
+
+    def __len__(self):
+        return len(self.names)
+
+    def _best(self, recs, n):
+        """The n heaviest distinct records, heaviest first (ties by name)."""
+        best = heapq.nlargest(n, set(recs), key=self.weights.__getitem__)
+        best.sort(key=lambda r: (-self.weights[r], self.names[r]))
+        return best
+
+    def _range(self, prefix, lo=0, hi=None):
+        hi = len(self.keys) if hi is None else hi
+        start = bisect_left(self.keys, prefix, lo, hi)
+        end = bisect_left(self.keys, prefix + '\U0010ffff', start, hi)
+        return start, end
+
+    def _precompute(self, prefix, lo, hi):
+        """Store the top records for a heavy prefix; returns them for the parent's merge."""
+        depth = len(prefix)
+        candidates = []
+        i = lo
+        while i < hi:
+            key = self.keys[i]
+            if len(key) == depth:
+                # The prefix itself is a complete key
+                candidates.append(self.key_recs[i])
+                i += 1
+                continue
+            child = key[:depth + 1]
+            _, end = self._range(child, i, hi)
+            if end - i > self.scan_limit:
+                candidates.extend(self._precompute(child, i, end))
+            else:
+                candidates.extend(heapq.nlargest(self.top_n * 2, self.key_recs[i:end],
+                                                 key=self.weights.__getitem__))
+            i = end
+        # Keep spare entries so results survive a few deletions in the overlay
+        best = self._best(candidates, self.top_n * 2)
+        if prefix:
+            self.heavy[prefix] = array('q', best)
+        return best
+
+    def lookup(self, prefix):
+        """Candidate record numbers for a normalised prefix, heaviest first."""
+        cached = self.heavy.get(prefix)
+        if cached is not None:
+            return cached
+        lo, hi = self._range(prefix)
+        return self._best(self.key_recs[lo:hi], self.top_n * 2)
+
+    def memory_bytes(self):
+        """Approximate footprint of the index structures."""
+        size = sys.getsizeof(self.keys) + sum(sys.getsizeof(k) for k in self.keys)
+        size += sys.getsizeof(self.names) + sum(sys.getsizeof(n) for n in self.names)
+        size += sys.getsizeof(self.kinds) + sys.getsizeof(self.ids) + sys.getsizeof(self.weights)
+        size += sys.getsizeof(self.key_recs) + sys.getsizeof(self.heavy)
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in self.heavy.items())
+        return size
+
+
+class Suggester:
+    """Typeahead for the search bar, weighted by how often products were ordered.
+
+    The index is built from the database on first use. Admin edits are applied
+    to a small overlay (changed records plus tombstones) that is merged into
+    every lookup, and the index is rebuilt in a background thread once the
+    overlay grows past ``max_overlay`` entries. Other worker processes see
+    admin edits after ``rebuild_seconds``, when they rebuild the same way.
+    """
+
+    def __init__(self, top_n=20, max_overlay=500, rebuild_seconds=600):
+        self.top_n = top_n
+        self.max_overlay = max_overlay
+        self.rebuild_seconds = rebuild_seconds
+        self.index = None
+        self.built_at = 0
+        # (kind, id) -> (name, weight, seq) and (kind, id) -> seq
+        self.overlay = {}
+        self.tombstones = {}
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.rebuilding = False
+
+    def load_records(self):
+        ordered = dict(db.session.execute(
+            select(Order.product_id, func.sum(Order.quantity)).group_by(Order.product_id)
+        ).all())
+        # Archived orders only survive as per-product totals
+        for product_id, quantity in db.session.execute(select(ProductSalesSummary.product_id, ProductSalesSummary.quantity)):
+            ordered[product_id] = ordered.get(product_id, 0) + quantity
+        category_weight = {}
+        records = []
+        for product_id, category_id, name in db.session.execute(select(Product.id, Product.category_id, Product.name)):
+            weight = ordered.get(product_id, 0)
+            category_weight[category_id] = category_weight.get(category_id, 0) + weight
+            records.append((PRODUCT, product_id, name, weight))
+        for category_id, name in db.session.execute(select(Category.id, Category.name)):
+            records.append((CATEGORY, category_id, name, category_weight.get(category_id, 0)))
+        return records
+
+    def rebuild(self):
+        started = self.seq
+        index = SuggestIndex(self.load_records(), top_n=self.top_n)
+        with self.lock:
+            self.index = index
+            self.built_at = time.monotonic()
+            # Patches made while the index was being built may be missing from it
+            self.overlay = {k: v for k, v in self.overlay.items() if v[2] > started}
+            self.tombstones = {k: seq for k, seq in self.tombstones.items() if seq > started}
+        return index
+
+    def _rebuild_in_background(self, app):
+        def run():
+            try:
+                with app.app_context():
+                    self.rebuild()
+            finally:
+                with self.lock:
+                    self.rebuilding = False
+        # Several requests can find the index stale at once; only one of them builds
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=run, daemon=True).start()
+
+    def _current_index(self):
+        if self.index is None:
+            return self.rebuild()
+        if not self.rebuilding and time.monotonic() - self.built_at > self.rebuild_seconds:
+            self._rebuild_in_background(current_app._get_current_object())
+        return self.index
+
+    def suggest(self, query, limit=10):
+        prefix = ' '.join(query.lower().split())
+        if not prefix:
+            return []
+        limit = min(limit, self.top_n)
+        index = self._current_index()
+        results = []
+        for rec in index.lookup(prefix):
+            entry = (index.kinds[rec], index.ids[rec])
+            if entry not in self.tombstones:
+                results.append((index.weights[rec], index.names[rec], entry))
+        for entry, (name, weight, _) in list(self.overlay.items()):
+            if any(key.startswith(prefix) for key in _word_starts(name)):
+                results.append((weight, name, entry))
+        results.sort(key=lambda r: (-r[0], r[1]))
+        return [{'type': KINDS[kind], 'id': record_id, 'name': name}
+                for weight, name, (kind, record_id) in results[:limit]]
+
+    def _patch(self, kind, record_id, name=None, weight=0):
+        if self.index is None:
+            return  # nothing built yet; the first lookup builds from the database
+        with self.lock:
+            self.seq += 1
+            self.tombstones[(kind, record_id)] = self.seq
+            if name is None:
+                self.overlay.pop((kind, record_id), None)
+            else:
+                self.overlay[(kind, record_id)] = (name, weight, self.seq)
+            too_big = len(self.overlay) + len(self.tombstones) > self.max_overlay
+        if too_big:
+            self._rebuild_in_background(current_app._get_current_object())
+
+    def product_changed(self, product):
+        weight = db.session.execute(
+            select(func.coalesce(func.sum(Order.quantity), 0)).where(Order.product_id == product.id)
+        ).scalar()
+        archived = db.session.get(ProductSalesSummary, product.id)
+        if archived:
+            weight += archived.quantity
+        self._patch(PRODUCT, product.id, product.name, weight)
+
+    def product_deleted(self, product_id):
+        self._patch(PRODUCT, product_id)
+
+    def category_changed(self, category):
+        weight = db.session.execute(
+            select(func.coalesce(func.sum(Order.quantity), 0))
+            .join(Product, Product.id == Order.product_id)
+            .where(Product.category_id == category.id)
+        ).scalar()
+        weight += db.session.execute(
+            select(func.coalesce(func.sum(ProductSalesSummary.quantity), 0))
+            .join(Product, Product.id == ProductSalesSummary.product_id)
+            .where(Product.category_id == category.id)
+        ).scalar()
+        self._patch(CATEGORY, category.id, category.name, weight)
+
+    def category_deleted(self, category_id):
+        self._patch(CATEGORY, category_id)
+
+
+suggester = Suggester()